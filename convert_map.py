@@ -0,0 +1,17 @@
+import argparse
+
+from playground.environment.world import convert_map, get_distance_map_file_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts the map image into the memory mapped map format')
+    parser.add_argument('image', help='Environmental map image filename')
+    parser.add_argument('output', help='Output .npy map filename')
+    args = parser.parse_args()
+
+    convert_map(args.image, args.output)
+    print(f'Saved {args.output} and {get_distance_map_file_name(args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+
+import playground.slam.frontend
+import playground.slam.backend
+import playground.slam.gtsambackend
+from playground.slam.keyframepolicy import KeyFramePolicy
+from playground.slam.loopdetector import LoopDetector
+from playground.slam.scanmatcher import CorrelativeScanMatcher
+from playground.headless import HeadlessSimulation, read_commands
+from playground.odometry import Odometry
+from playground.recording import LogWriter
+from playground.sensor import Sensor
+from playground.environment.world import World
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the SLAM pipeline with a scripted trajectory without rendering')
+    parser.add_argument('filename', help='Environmental map filename')
+    parser.add_argument('commands', help='Scripted trajectory filename')
+    parser.add_argument('--backend', choices=['basic', 'gtsam'], default='basic', help='Pose graph backend')
+    parser.add_argument('--log', help='Filename to record sensor scans and poses for the replay')
+    parser.add_argument('--threaded', action='store_true', help='Simulate the robot in a background thread')
+    parser.add_argument('--key-frames', action='store_true',
+                        help='Add key frames only after large enough motion instead of every step')
+    parser.add_argument('--detect-loops', action='store_true',
+                        help='Detect loop closures automatically in addition to scripted ones')
+    parser.add_argument('--no-point-ids', action='store_true',
+                        help='Align scans with nearest neighbours instead of simulator point ids')
+    parser.add_argument('--scan-matcher', action='store_true',
+                        help='Find the initial guess of the ICP with the correlative scan matcher, '
+                             'it is used only with --no-point-ids')
+    parser.add_argument('--odometry-edges', action='store_true',
+                        help='Add odometry motions between key frames into the pose graph')
+    args = parser.parse_args()
+
+    # Create simulation objects
+    world = World(args.filename)
+    odometry = Odometry(mu=0, sigma=3)  # noised measurements
+    sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=1)  # noised measurements
+    key_frame_policy = KeyFramePolicy() if args.key_frames else None
+    loop_detector = LoopDetector(max_range=350) if args.detect_loops else None
+    scan_matcher = CorrelativeScanMatcher() if args.scan_matcher else None
+    slam_front_end = playground.slam.frontend.FrontEnd(world.height, world.width, use_point_ids=not args.no_point_ids,
+                                                       key_frame_policy=key_frame_policy, loop_detector=loop_detector,
+                                                       scan_matcher=scan_matcher)
+    if args.backend == 'gtsam':
+        slam_back_end = playground.slam.gtsambackend.GTSAMBackEnd(edge_sigma=0.5, angle_sigma=0.1, incremental=True,
+                                                                  odometry_edges=args.odometry_edges)
+    else:
+        slam_back_end = playground.slam.backend.BackEnd(edge_sigma=0.5, angle_sigma=0.1, incremental=True,
+                                                        odometry_edges=args.odometry_edges)
+
+    commands = read_commands(args.commands)
+    log_writer = LogWriter(args.log, world.height, world.width) if args.log else None
+    simulation = HeadlessSimulation(world, odometry, sensor, slam_front_end, slam_back_end, log_writer)
+    steps_per_second = simulation.run(commands, threaded_simulation=args.threaded)
+    if log_writer is not None:
+        log_writer.close()
+    print(f'Executed {len(commands)} steps, {len(slam_front_end.get_frames())} key frames, '
+          f'{steps_per_second:.1f} steps/sec')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import numpy as np
+from skimage.draw import line_aa
+
+
+class RayCaster:
+    """
+        Batched ray casting against the world obstacle map.
+        All rays of a scan are rasterized and tested for obstacles at once.
+    """
+
+    def __init__(self, max_cached_rays=4096, max_march_steps=8, hit_window=16):
+        self.__max_cached_rays = max_cached_rays
+        self.__max_march_steps = max_march_steps
+        self.__hit_window = hit_window
+        # anti-aliased ray pixels are not further than 1 pixel from the ray line
+        # and a pixel center is not further than sqrt(2)/2 from the ray point
+        self.__march_margin = 2
+        self.__ray_cache = dict()
+
+    def __get_ray(self, offset):
+        # line_aa is translation invariant for integer end points,
+        # so a ray is fully defined by its end point relative to the start
+        key = (int(offset[0]), int(offset[1]))
+        ray = self.__ray_cache.get(key)
+        if ray is None:
+            if len(self.__ray_cache) >= self.__max_cached_rays:
+                self.__ray_cache.clear()
+            ys, xs, _ = line_aa(0, 0, key[0], key[1])
+            points = np.stack([ys, xs], axis=1)
+            # pixels are not strictly ordered along the ray, so use the running maximum of their projections
+            length = max(np.hypot(key[0], key[1]), 1)
+            projections = np.maximum.accumulate((ys * key[0] + xs * key[1]) / length)
+            # index of the first pixel which projection is not less than the given integer distance
+            first_indices = np.searchsorted(projections, np.arange(int(length) + 2)).tolist()
+            ray = points, first_indices
+            self.__ray_cache[key] = ray
+        return ray
+
+    def __march(self, start_pos, offsets, world):
+        """
+        Sphere tracing with the world distance map, finds the ray distances which can be skipped safely
+        """
+        lengths = np.linalg.norm(offsets, axis=1)
+        directions = offsets / np.maximum(lengths, 1)[:, None]
+        distances = np.zeros(offsets.shape[0])
+        for _ in range(self.__max_march_steps):
+            ray_points = np.rint(start_pos + distances[:, None] * directions).astype(int)
+            # a ray stops at the point where it can't make a step, so it's safe to update all rays
+            steps = np.maximum(world.get_obstacle_distances(ray_points) - self.__march_margin, 0)
+            distances += steps
+            if not np.any(steps[distances < lengths]):
+                break
+        return distances
+
+    def cast(self, start_pos, end_positions, world):
+        """
+        Traces rays from the start_pos to every end position and finds the first obstacle on each of them.
+        Returns the obstacles coordinates and their ids in the order of rays.
+        """
+        start_pos = np.asarray(start_pos, dtype=int)
+        offsets = np.asarray(end_positions, dtype=int) - start_pos
+        if offsets.shape[0] == 0:
+            return np.empty((0, 2), dtype=int), np.empty(0, dtype=int)
+
+        # skip ray parts which are in the empty space for sure
+        skip_distances = self.__march(start_pos, offsets, world).astype(int).tolist()
+        near_rays = []
+        far_rays = []
+        for offset, skip_distance in zip(offsets, skip_distances):
+            points, first_indices = self.__get_ray(offset)
+            near_begin = first_indices[min(skip_distance, len(first_indices) - 1)]
+            far_begin = first_indices[min(skip_distance + self.__hit_window, len(first_indices) - 1)]
+            near_rays.append(points[near_begin:far_begin])
+            far_rays.append(points[far_begin:])
+
+        # obstacles are usually right behind the skipped part, so check rest of rays only if nothing was found
+        hit_rays, obstacles_coords = self.__find_first_hits(start_pos, near_rays, world)
+        missed_rays = np.setdiff1d(np.arange(len(far_rays)), hit_rays)
+        if missed_rays.size > 0:
+            far_hit_rays, far_obstacles_coords = self.__find_first_hits(
+                start_pos, [far_rays[i] for i in missed_rays], world)
+            hit_rays = np.concatenate([hit_rays, missed_rays[far_hit_rays]])
+            obstacles_coords = np.concatenate([obstacles_coords, far_obstacles_coords])
+            obstacles_coords = obstacles_coords[np.argsort(hit_rays)]
+
+        obstacles_ids = world.get_obstacle_ids(obstacles_coords)
+        return obstacles_coords, obstacles_ids
+
+    @staticmethod
+    def __find_first_hits(start_pos, rays, world):
+        ray_indices = np.repeat(np.arange(len(rays)), [ray.shape[0] for ray in rays])
+        points = np.concatenate(rays) + start_pos
+        # points are stored in the tracing order, so take the first hit per ray
+        hits = np.flatnonzero(world.get_obstacles_mask(points))
+        hit_rays, first_hits = np.unique(ray_indices[hits], return_index=True)
+        return hit_rays, points[hits[first_hits]]
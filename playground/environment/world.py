@@ -1,9 +1,51 @@
 import math
+import os
 
 from PIL import Image
 from hilbertcurve.hilbertcurve import HilbertCurve
 import numpy as np
 import pygame
+from scipy import ndimage
+
+from playground.utils.hilbert import hilbert_distances
+
+
+def read_image_map(file_name):
+    """
+    Reads the map image, only the first channel is used, free cells have the 255 value
+    """
+    image_map = np.array(Image.open(file_name))
+    if image_map.ndim == 3:
+        image_map = image_map[:, :, 0]
+    return np.ascontiguousarray(image_map)
+
+
+MAX_SQ_DISTANCE = np.iinfo(np.uint16).max  # squared distances are saturated to fit two bytes per cell
+
+
+def compute_sq_distance_map(free_space):
+    """
+    Computes squared Euclidean distances from every free map cell to the nearest obstacle,
+    distances longer than 255 pixels are saturated
+    """
+    if free_space.all():
+        return np.full(free_space.shape, MAX_SQ_DISTANCE, dtype=np.uint16)
+    distances = ndimage.distance_transform_edt(free_space)
+    return np.minimum(np.rint(distances ** 2), MAX_SQ_DISTANCE).astype(np.uint16)
+
+
+def get_distance_map_file_name(map_file_name):
+    return os.path.splitext(map_file_name)[0] + '_distance.npy'
+
+
+def convert_map(image_file_name, map_file_name):
+    """
+    Converts the map image into the .npy bit-packed obstacles map and the precomputed distance map files
+    which can be memory mapped, the map width is stored as the distance map width
+    """
+    image_map = read_image_map(image_file_name)
+    np.save(map_file_name, np.packbits(image_map != 255, axis=1))
+    np.save(get_distance_map_file_name(map_file_name), compute_sq_distance_map(image_map == 255))
 
 
 class World:
@@ -15,21 +57,61 @@ class World:
         self.__map_file_name = map_file_name
         self.__width = 0
         self.__height = 0
-        self.__map = None
+        self.__obstacles = None  # bit-packed obstacles map, every byte keeps eight cells of a row
+        self.__bit_masks = np.array([128, 64, 32, 16, 8, 4, 2, 1], dtype=np.uint8)  # cell masks in the packed byte
+        self.__sq_distance_map = None
+        self.__surface = None  # the map image is drawn once, the map doesn't change
+        self.__disk_stencils = dict()
         self.read_map()
+        self.build_distance_map()
 
         # Initialize Hilbert curve object for generating obstacle ids
+        # the curve side should cover the largest map side
         max_side = max(self.__width, self.__height)
-        side_len = math.ceil(math.log2(max_side * max_side)) // 2
+        side_len = max(math.ceil(math.log2(max_side)), 1)
         self.__hilbert_curve = HilbertCurve(p=side_len, n=2)
 
+    def __is_preprocessed(self):
+        return self.__map_file_name.endswith('.npy')
+
     def read_map(self):
-        img = Image.open(self.__map_file_name)
-        self.__width = img.size[0]
-        self.__height = img.size[1]
-        img.convert('1')  # make image binary
-        self.__map = np.array(img)
-        self.__map = self.__map[:, :, 0]
+        if self.__is_preprocessed():
+            # maps are memory mapped read-only, so processes share their pages,
+            # packed rows are padded to whole bytes so the map size comes from the distance map
+            self.__sq_distance_map = np.load(get_distance_map_file_name(self.__map_file_name), mmap_mode='r')
+            self.__height, self.__width = self.__sq_distance_map.shape
+            self.__obstacles = np.load(self.__map_file_name, mmap_mode='r')
+            if self.__obstacles.shape != (self.__height, (self.__width + 7) >> 3):
+                raise ValueError(f'The map {self.__map_file_name} does not match its distance map')
+        else:
+            world_map = read_image_map(self.__map_file_name)
+            self.__height, self.__width = world_map.shape
+            self.__obstacles = np.packbits(world_map != 255, axis=1)
+
+    def build_distance_map(self):
+        """
+        Precomputes squared Euclidean distances from every map cell to the nearest obstacle.
+        It allows to skip an empty space during ray tracing and to check collisions with a single lookup.
+        Preprocessed maps load the distance map stored with them.
+        """
+        if self.__is_preprocessed():
+            return
+        free_space = ~self.__get_obstacles_window(0, self.__height, 0, self.__width)
+        self.__sq_distance_map = compute_sq_distance_map(free_space)
+
+    def __get_obstacles(self, y, x):
+        """
+        Returns obstacle flags of map cells, coordinates have to be inside the map
+        """
+        return (self.__obstacles[y, x >> 3] & self.__bit_masks[x & 7]) != 0
+
+    def __get_obstacles_window(self, y_begin, y_end, x_begin, x_end):
+        """
+        Unpacks obstacle flags of the map region into a boolean array
+        """
+        bits = np.unpackbits(self.__obstacles[y_begin:y_end, x_begin >> 3:(x_end + 7) >> 3], axis=1)
+        bit_begin = x_begin & 7
+        return bits[:, bit_begin:bit_begin + x_end - x_begin].view(bool)
 
     @property
     def width(self):
@@ -40,28 +122,68 @@ class World:
         return self.__height
 
     def draw(self, screen):
-        transposed_map = np.transpose(self.__map)
-        surf = pygame.surfarray.make_surface(transposed_map)
-        screen.blit(surf, (0, 0))
+        if self.__surface is None:
+            world_map = np.where(self.__get_obstacles_window(0, self.__height, 0, self.__width), 0, 255)
+            self.__surface = pygame.surfarray.make_surface(np.transpose(world_map.astype(np.uint8)))
+        screen.blit(self.__surface, (0, 0))
         pygame.draw.circle(screen, color=(255, 0, 0), center=(self.__width // 2, self.__height // 2), radius=10)
 
     def allow_move(self, pos, size):
+        x = int(self.__width // 2 + pos[1])
+        y = int(self.__height // 2 - pos[0])
+        if 0 <= y < self.__height and 0 <= x < self.__width:
+            # an obstacle is in the circle if its truncated distance is not greater than the radius
+            min_distance = math.floor(size) + 1
+            if min_distance ** 2 <= MAX_SQ_DISTANCE:
+                return self.__sq_distance_map[y, x] >= min_distance ** 2
         obstacles_coords = self.get_obstacles_in_circle(pos, size)
         num = obstacles_coords.size
         return num == 0
 
+    def allow_moves(self, positions, size):
+        """
+        Vectorized version of the allow_move, checks many candidate positions at once
+        """
+        positions = np.asarray(positions)
+        x = (self.__width // 2 + positions[:, 1]).astype(int)
+        y = (self.__height // 2 - positions[:, 0]).astype(int)
+        inside = (0 <= y) & (y < self.__height) & (0 <= x) & (x < self.__width)
+        min_distance = math.floor(size) + 1
+        # saturated distances can't be compared with larger bodies
+        inside &= min_distance ** 2 <= MAX_SQ_DISTANCE
+        allowed = np.zeros(positions.shape[0], dtype=bool)
+        allowed[inside] = self.__sq_distance_map[y[inside], x[inside]] >= min_distance ** 2
+        for index in np.flatnonzero(~inside):
+            allowed[index] = self.get_obstacles_in_circle(positions[index], size).size == 0
+        return allowed
+
+    def __get_disk_stencil(self, radius):
+        stencil = self.__disk_stencils.get(radius)
+        if stencil is None:
+            half_size = math.floor(radius)
+            y_ind, x_ind = np.ogrid[-half_size:half_size + 1, -half_size:half_size + 1]
+            dist_from_center = np.sqrt(x_ind ** 2 + y_ind ** 2).astype(int)
+            stencil = dist_from_center <= radius
+            self.__disk_stencils[radius] = stencil
+        return stencil
+
     def get_obstacles_in_circle(self, pos, radius):
         x = self.__width // 2 + pos[1]
         y = self.__height // 2 - pos[0]
         x = np.clip(x, 0, self.__width).astype(int)
         y = np.clip(y, 0, self.__height).astype(int)
 
-        h, w = self.__map.shape
-        y_ind, x_ind = np.ogrid[:h, :w]
-        dist_from_center = np.sqrt((x_ind - x) ** 2 + (y_ind - y) ** 2).astype(int)
-        region_coords = np.argwhere(dist_from_center <= radius)
-        obstacles_mask = self.__map[region_coords[:, 0], region_coords[:, 1]] != 255
-        region_coords = region_coords[obstacles_mask]
+        # check only the circle bounding window
+        h, w = self.__height, self.__width
+        stencil = self.__get_disk_stencil(radius)
+        half_size = stencil.shape[0] // 2
+        y_begin, y_end = max(y - half_size, 0), min(y + half_size + 1, h)
+        x_begin, x_end = max(x - half_size, 0), min(x + half_size + 1, w)
+        stencil = stencil[y_begin - y + half_size:y_end - y + half_size,
+                          x_begin - x + half_size:x_end - x + half_size]
+        obstacles_mask = self.__get_obstacles_window(y_begin, y_end, x_begin, x_end)
+        region_coords = np.argwhere(obstacles_mask & stencil)
+        region_coords += [y_begin, x_begin]
         # convert to world coordinates
         region_coords[:, 0] = h // 2 - region_coords[:, 0]
         region_coords[:, 1] = region_coords[:, 1] - w // 2
@@ -71,7 +193,40 @@ class World:
         x = self.__width // 2 + pos[1]
         y = self.__height // 2 - pos[0]
         if 0 <= y < self.__height and 0 <= x < self.__width:
-            if self.__map[y, x] != 255:
+            if self.__get_obstacles(y, x):
                 point_id = self.__hilbert_curve.distance_from_point([y, x])
                 return True, point_id
         return False, None
+
+    def get_obstacles_mask(self, positions):
+        """
+        Vectorized version of the is_obstacle, positions is a (n, 2) array of world coordinates
+        """
+        x = self.__width // 2 + positions[:, 1]
+        y = self.__height // 2 - positions[:, 0]
+        inside = (0 <= y) & (y < self.__height) & (0 <= x) & (x < self.__width)
+        mask = np.zeros(positions.shape[0], dtype=bool)
+        mask[inside] = self.__get_obstacles(y[inside], x[inside])
+        return mask
+
+    def get_obstacle_distances(self, positions):
+        """
+        Returns distances from the positions to the nearest obstacles, positions outside the map have zero distance.
+        Distances longer than 255 pixels are saturated.
+        """
+        x = self.__width // 2 + positions[:, 1]
+        y = self.__height // 2 - positions[:, 0]
+        inside = (0 <= y) & (y < self.__height) & (0 <= x) & (x < self.__width)
+        distances = np.zeros(positions.shape[0])
+        distances[inside] = np.sqrt(self.__sq_distance_map[y[inside], x[inside]])
+        return distances
+
+    def get_obstacle_ids(self, positions):
+        """
+        Vectorized version of the obstacle ids generation, positions is a (n, 2) array of world coordinates
+        """
+        # ids are computed per scan, an id raster would need 4 bytes per cell for ids up to 2**(2p),
+        # twice the distance map, and building it for the 800x600 map takes as long as a few hundred scans
+        x = self.__width // 2 + positions[:, 1]
+        y = self.__height // 2 - positions[:, 0]
+        return hilbert_distances(np.stack([y, x], axis=1), self.__hilbert_curve.p)
@@ -0,0 +1,112 @@
+import time
+from enum import Enum
+
+from playground.pipeline import back_end_stage, front_end_stage, threaded
+from playground.recording import LogStep
+from playground.robot import Robot
+
+
+class Command(Enum):
+    ROTATE = 'rotate'
+    MOVE = 'move'
+    LOOP_CLOSURE = 'loop_closure'
+
+
+def read_commands(file_name):
+    """
+    Reads a scripted trajectory, every line is a command name with an optional value and repeats count:
+        rotate 10
+        move 10 5
+        loop_closure
+    Empty lines and lines started with # are skipped.
+    """
+    commands = []
+    with open(file_name) as file:
+        for line in file:
+            line = line.split('#', 1)[0].split()
+            if len(line) == 0:
+                continue
+            command = Command(line[0])
+            value = float(line[1]) if len(line) > 1 else 0.
+            repeats = int(line[2]) if len(line) > 2 else 1
+            commands.extend([(command, value)] * repeats)
+    return commands
+
+
+def write_commands(file_name, commands):
+    with open(file_name, 'w') as file:
+        for command, value in commands:
+            file.write(f'{command.value} {value:g}\n')
+
+
+def simulation_steps(world, robot, odometry, sensor, commands):
+    """
+    Executes commands with the robot and yields a step with the sensor scan and poses after every command,
+    the first step is made before commands
+    """
+    def make_step(loop_closure=False):
+        return LogStep(sensor.get_obstacles(), odometry.position.copy(), odometry.rotation.copy(),
+                       robot.position.copy(), robot.rotation.copy(), loop_closure)
+
+    # make first initialization
+    robot.move(0, world)
+    yield make_step()
+
+    for command, value in commands:
+        if command == Command.ROTATE:
+            robot.rotate(value, world)
+        elif command == Command.MOVE:
+            robot.move(value, world)
+        # we assume that we detect a loop so can try to optimize pose graph
+        yield make_step(loop_closure=command == Command.LOOP_CLOSURE)
+
+
+def write_steps(steps, log_writer):
+    for step in steps:
+        log_writer.write_step(step)
+        yield step
+
+
+class HeadlessSimulation:
+    """
+    Drives the robot and the SLAM pipeline with a list of commands without rendering
+    """
+
+    def __init__(self, world, odometry, sensor, front_end, back_end, log_writer=None):
+        self.__world = world
+        self.__odometry = odometry
+        self.__sensor = sensor
+        self.__robot = Robot(odometry, sensor)
+        self.__front_end = front_end
+        self.__back_end = back_end
+        self.__ground_truth = []  # real robot positions for every frame added to the front end
+        self.__log_writer = log_writer  # records every step for the replay
+
+    @property
+    def robot(self):
+        return self.__robot
+
+    @property
+    def ground_truth(self):
+        return self.__ground_truth
+
+    def run(self, commands, threaded_simulation=False):
+        """
+        Executes commands and returns the number of steps per second.
+        With threaded_simulation the robot and the sensor are simulated in a background thread,
+        so scanning overlaps with the scan alignment and the pose graph optimization.
+        """
+        start_time = time.perf_counter()
+
+        steps = simulation_steps(self.__world, self.__robot, self.__odometry, self.__sensor, commands)
+        if self.__log_writer is not None:
+            steps = write_steps(steps, self.__log_writer)
+        if threaded_simulation:
+            steps = threaded(steps)
+        results = back_end_stage(front_end_stage(steps, self.__front_end), self.__front_end, self.__back_end)
+        for result in results:
+            if result.frame is not None:
+                self.__ground_truth.append(result.step.robot_position)
+
+        end_time = time.perf_counter()
+        return len(commands) / max(end_time - start_time, 1e-9)
@@ -4,15 +4,17 @@ from playground.environment.body import Body
 
 
 class Odometry(Body):
-    def __init__(self, mu, sigma):
+    def __init__(self, mu, sigma, rng=None):
         super().__init__()
         self.__mu = mu
         self.__sigma = sigma
+        # the noise generator, the global numpy random state is used by default
+        self.__rng = np.random if rng is None else rng
 
     def track_rotate(self, angle):
-        noise = np.random.normal(self.__mu, self.__sigma)
+        noise = self.__rng.normal(self.__mu, self.__sigma)
         self.rotate(angle + noise)
 
     def track_move(self, dist):
-        noise = np.random.normal(self.__mu, self.__sigma)
+        noise = self.__rng.normal(self.__mu, self.__sigma)
         self.move(dist + noise)
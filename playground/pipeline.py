@@ -0,0 +1,166 @@
+import multiprocessing
+import queue
+import threading
+from collections import namedtuple
+
+FrontEndResult = namedtuple('FrontEndResult', ['step', 'frame', 'loop_frame'])
+
+
+class ReplaySensor:
+    """
+    Gives scans from steps to the SLAM front end instead of the real sensor
+    """
+
+    def __init__(self):
+        self.__obstacles = None
+
+    def get_obstacles(self):
+        return self.__obstacles
+
+    def update(self, scan):
+        self.__obstacles = scan
+
+
+class ReplayOdometry:
+    """
+    Gives odometry poses from steps to the SLAM front end instead of the real odometry
+    """
+
+    def __init__(self):
+        self.position = None
+        self.rotation = None
+
+    def update(self, position, rotation):
+        self.position = position
+        self.rotation = rotation
+
+
+def front_end_stage(steps, front_end):
+    """
+    Aligns scans from steps with the front end, yields the new key frame or the loop closure frame for every step
+    """
+    sensor = ReplaySensor()
+    odometry = ReplayOdometry()
+    for step in steps:
+        sensor.update(step.scan)
+        odometry.update(step.odometry_position, step.odometry_rotation)
+        if step.loop_closure:
+            # the tracked frame becomes a key frame before the loop closure
+            num_frames = len(front_end.get_frames())
+            loop_frame = front_end.create_loop_closure(sensor)
+            frame = front_end.get_frames()[-1] if len(front_end.get_frames()) > num_frames else None
+            yield FrontEndResult(step, frame, loop_frame)
+        elif front_end.add_key_frame(sensor, odometry):
+            # the loop is detected automatically if the front end has a loop detector
+            yield FrontEndResult(step, front_end.get_frames()[-1], front_end.detect_loop_closure())
+        else:
+            yield FrontEndResult(step, None, None)
+
+
+def back_end_stage(results, front_end, back_end):
+    """
+    Optimizes the pose graph on every detected loop closure, results are passed through.
+    The back end updates frames of the front end so both stages have to run in the same thread.
+    """
+    for result in results:
+        if result.loop_frame is not None:
+            back_end.update_frames(front_end.get_frames(), result.loop_frame)
+        yield result
+
+
+class _EndOfStream:
+    pass
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(item_queue, item, stop_event):
+    """
+    Waits for a free place in the queue, returns False if the consumer was stopped
+    """
+    while not stop_event.is_set():
+        try:
+            item_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(items_factory, args, item_queue, stop_event):
+    """
+    Puts items created by the items_factory(*args) into the queue, errors of the factory call are forwarded too
+    """
+    try:
+        for item in items_factory(*args):
+            if not _put(item_queue, item, stop_event):
+                return
+        _put(item_queue, _EndOfStream(), stop_event)
+    except Exception as error:
+        _put(item_queue, _StageError(error), stop_event)
+
+
+def _get(item_queue, worker):
+    """
+    Waits for the next item, raises RuntimeError if the worker stopped without the end of stream,
+    e.g. the process was killed by a signal
+    """
+    while True:
+        try:
+            return item_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+        if not worker.is_alive():
+            # the last items may arrive after the worker exit
+            try:
+                return item_queue.get(timeout=0.1)
+            except queue.Empty:
+                exit_code = getattr(worker, 'exitcode', None)
+                raise RuntimeError(f'Pipeline stage worker stopped unexpectedly, exit code {exit_code}')
+
+
+def _consume(item_queue, worker):
+    while True:
+        item = _get(item_queue, worker)
+        if isinstance(item, _EndOfStream):
+            return
+        if isinstance(item, _StageError):
+            raise item.error
+        yield item
+
+
+def threaded(items, max_size=8):
+    """
+    Iterates items in a background thread, at most max_size items are buffered between threads
+    """
+    item_queue = queue.Queue(maxsize=max_size)
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_produce, args=(iter, (items,), item_queue, stop_event), daemon=True)
+    thread.start()
+    try:
+        yield from _consume(item_queue, thread)
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def in_process(items_factory, *args, max_size=8):
+    """
+    Iterates items created by the items_factory(*args) in a child process,
+    the factory, its arguments and items have to be picklable
+    """
+    context = multiprocessing.get_context('spawn')
+    item_queue = context.Queue(maxsize=max_size)
+    stop_event = context.Event()
+    process = context.Process(target=_produce, args=(items_factory, args, item_queue, stop_event), daemon=True)
+    process.start()
+    try:
+        yield from _consume(item_queue, process)
+    finally:
+        stop_event.set()
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
@@ -0,0 +1,150 @@
+import io
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from playground.pipeline import back_end_stage, front_end_stage
+
+LogStep = namedtuple('LogStep', ['scan', 'odometry_position', 'odometry_rotation', 'robot_position',
+                                 'robot_rotation', 'loop_closure'])
+
+LOG_MAGIC = b'SLAMLOG1'
+
+
+class LogWriter:
+    """
+    Writes simulation steps into an append-only binary log.
+    The log starts with a header chunk, every next chunk is an uncompressed .npz archive with columns of
+    a number of steps, chunks are prefixed with their size so the log can be read as a stream.
+    """
+
+    def __init__(self, file_name, world_h, world_w, chunk_size=256):
+        self.__file = open(file_name, 'wb')
+        self.__file.write(LOG_MAGIC)
+        self.__write_chunk(world_size=np.array([world_h, world_w]))
+        self.__chunk_size = chunk_size
+        self.__steps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __write_chunk(self, **columns):
+        buffer = io.BytesIO()
+        np.savez(buffer, **columns)
+        self.__file.write(struct.pack('<Q', buffer.getbuffer().nbytes))
+        self.__file.write(buffer.getbuffer())
+
+    def write(self, scan, odometry, robot, loop_closure=False):
+        """
+        Adds the step with the sensor scan, may be None, and the odometry and real robot poses
+        """
+        self.write_step(LogStep(scan, odometry.position.copy(), odometry.rotation.copy(),
+                                robot.position.copy(), robot.rotation.copy(), loop_closure))
+
+    def write_step(self, step):
+        scan = np.empty((0, 3), dtype=int) if step.scan is None else np.array(step.scan)
+        self.__steps.append(step._replace(scan=scan))
+        if len(self.__steps) >= self.__chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.__steps) > 0:
+            scans = [step.scan for step in self.__steps]
+            self.__write_chunk(
+                scan_points=np.concatenate(scans),
+                scan_sizes=np.array([scan.shape[0] for scan in scans]),
+                odometry_positions=np.array([step.odometry_position for step in self.__steps]),
+                odometry_rotations=np.array([step.odometry_rotation for step in self.__steps]),
+                robot_positions=np.array([step.robot_position for step in self.__steps]),
+                robot_rotations=np.array([step.robot_rotation for step in self.__steps]),
+                loop_closures=np.array([step.loop_closure for step in self.__steps]))
+            self.__steps = []
+        self.__file.flush()
+
+    def close(self):
+        if not self.__file.closed:
+            self.flush()
+            self.__file.close()
+
+
+class LogReader:
+    """
+    Reads steps from the log chunk by chunk
+    """
+
+    def __init__(self, file_name):
+        self.__file_name = file_name
+        with open(file_name, 'rb') as file:
+            self.__check_magic(file)
+            header = self.__read_chunk(file)
+        self.__height, self.__width = header['world_size']
+
+    @property
+    def height(self):
+        return self.__height
+
+    @property
+    def width(self):
+        return self.__width
+
+    @staticmethod
+    def __check_magic(file):
+        if file.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError('Unsupported log format')
+
+    @staticmethod
+    def __read_chunk(file):
+        size = file.read(8)
+        if len(size) < 8:
+            return None
+        size = struct.unpack('<Q', size)[0]
+        return np.load(io.BytesIO(file.read(size)))
+
+    def __iter__(self):
+        with open(self.__file_name, 'rb') as file:
+            self.__check_magic(file)
+            self.__read_chunk(file)
+            while True:
+                chunk = self.__read_chunk(file)
+                if chunk is None:
+                    break
+                scans = np.split(chunk['scan_points'], np.cumsum(chunk['scan_sizes'])[:-1])
+                for step in zip(scans, chunk['odometry_positions'], chunk['odometry_rotations'],
+                                chunk['robot_positions'], chunk['robot_rotations'], chunk['loop_closures']):
+                    scan = step[0] if step[0].shape[0] > 0 else None
+                    yield LogStep(scan, *step[1:5], bool(step[5]))
+
+
+class LogReplay:
+    """
+    Feeds recorded steps into the SLAM pipeline without the world simulation
+    """
+
+    def __init__(self, front_end, back_end):
+        self.__front_end = front_end
+        self.__back_end = back_end
+        self.__ground_truth = []  # real robot positions for every frame added to the front end
+
+    @property
+    def ground_truth(self):
+        return self.__ground_truth
+
+    def run(self, steps):
+        """
+        Processes steps and returns the number of steps per second
+        """
+        start_time = time.perf_counter()
+        num_steps = 0
+        results = back_end_stage(front_end_stage(steps, self.__front_end), self.__front_end, self.__back_end)
+        for result in results:
+            if result.frame is not None:
+                self.__ground_truth.append(result.step.robot_position)
+            num_steps += 1
+
+        end_time = time.perf_counter()
+        return num_steps / max(end_time - start_time, 1e-9)
@@ -1,18 +1,18 @@
-import math
-
 import pygame
 import numpy as np
-from skimage.draw import line_aa
 
+from playground.environment.raycaster import RayCaster
 from playground.utils.transform import to_screen_coords, make_direction, transform_points
 
 
 class Sensor:
-    def __init__(self, dist_range, fov, mu, sigma):
+    def __init__(self, dist_range, fov, mu, sigma, rng=None):
         self.__dist_range = dist_range
         self.__fov = fov
         self.__mu = mu
         self.__sigma = sigma
+        # the noise generator, the global numpy random state is used by default
+        self.__rng = np.random if rng is None else rng
         self.__obstacles = None
 
         # generate scan arc coordinates
@@ -21,41 +21,31 @@ class Sensor:
         x = np.cos(theta)
         y = np.sin(theta)
         self.__circle_coords = np.stack([x, y], axis=1)
+        self.__ray_caster = RayCaster()
 
     def get_obstacles(self):
         return self.__obstacles
 
     def scan(self, position, rotation, world):
-        # do ray tracing
-        obstacles_coords = []
-        obstacles_ids = []
-        start_pos = position
+        # select scan directions inside the field of view
         direction = make_direction(rotation)
-        for circle_dir in self.__circle_coords:
-            dot_product = np.dot(direction, circle_dir)
-            scan_angle = math.acos(np.clip(dot_product, -1., 1))
-            scan_angle = np.degrees(scan_angle)
-            if scan_angle <= self.__fov / 2:
-                end_pos = (start_pos + circle_dir * self.__dist_range).astype(int)
-                start_pos = start_pos.astype(int)
-                end_pos = end_pos.astype(int)
-                ys, xs, _ = line_aa(start_pos[0], start_pos[1], end_pos[0], end_pos[1])
-                for pos in zip(ys, xs):
-                    is_obstacle, obstacle_id = world.is_obstacle(pos)
-                    if is_obstacle:
-                        obstacles_coords.append(pos)
-                        obstacles_ids.append(obstacle_id)
-                        break
+        dot_products = self.__circle_coords @ direction
+        scan_angles = np.degrees(np.arccos(np.clip(dot_products, -1., 1.)))
+        scan_directions = self.__circle_coords[scan_angles <= self.__fov / 2]
+
+        # do ray tracing
+        start_pos = position.astype(int)
+        end_positions = (start_pos + scan_directions * self.__dist_range).astype(int)
+        obstacles_coords, obstacles_ids = self.__ray_caster.cast(start_pos, end_positions, world)
 
         if len(obstacles_coords) > 0:
-            obstacles_coords = np.array(obstacles_coords)
-            obstacles_ids = np.array(obstacles_ids).reshape((-1, 1))
+            obstacles_ids = obstacles_ids.reshape((-1, 1))
             # Transform obstacles into the sensor/robot coordinate system
             obstacles_coords -= start_pos
             obstacles_coords = transform_points(obstacles_coords, np.linalg.inv(rotation))
 
             # Adding noise
-            noise = np.random.normal(self.__mu, self.__sigma, size=obstacles_coords.shape)
+            noise = self.__rng.normal(self.__mu, self.__sigma, size=obstacles_coords.shape)
             obstacles_coords += noise.astype(int)
 
             self.__obstacles = np.hstack([obstacles_coords, obstacles_ids])
@@ -0,0 +1,123 @@
+import threading
+
+import numpy as np
+
+from playground.slam.frame import Frame
+
+
+def copy_frame(frame):
+    """
+    Copies the frame poses, observed points are shared
+    """
+    frame_copy = Frame(frame.observed_points)
+    frame_copy.position = frame.position.copy()
+    frame_copy.rotation = frame.rotation.copy()
+    frame_copy.relative_icp_position = np.array(frame.relative_icp_position, dtype=float)
+    frame_copy.relative_icp_rotation = frame.relative_icp_rotation.copy()
+    frame_copy.reference_index = frame.reference_index
+    frame_copy.extra_edges = list(frame.extra_edges)
+    frame_copy.odometry_position = frame.odometry_position
+    frame_copy.odometry_rotation = frame.odometry_rotation
+    return frame_copy
+
+
+def get_pose_matrix(frame):
+    """
+    Homogeneous transformation from the frame coordinate system into the world one
+    """
+    tr = np.identity(3)
+    tr[:2, :2] = frame.rotation[:2, :2]
+    tr[:2, 2] = frame.position[:2]
+    return tr
+
+
+class AsyncBackEnd:
+    """
+    Runs the back end optimization in a background thread with copies of frames,
+    optimized poses are applied to the original frames by the apply_results call
+    """
+
+    def __init__(self, back_end):
+        self.__back_end = back_end
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__last_pose = None  # the last frame pose before the optimization
+        self.__results = None  # optimized frames copies which aren't applied yet
+        self.__error = None  # the optimization exception, it's raised by the apply_results
+        self.__progress = (0, 0.)  # the last optimization iteration and the error
+
+    @property
+    def busy(self):
+        return self.__thread is not None
+
+    @property
+    def progress(self):
+        with self.__lock:
+            return self.__progress
+
+    def __set_progress(self, iteration, error):
+        with self.__lock:
+            self.__progress = (iteration, error)
+
+    def __optimize(self, frames, loop_frame):
+        try:
+            self.__back_end.update_frames(frames, loop_frame, progress_callback=self.__set_progress)
+        except Exception as error:
+            with self.__lock:
+                self.__error = error
+                self.__results = []
+            return
+        with self.__lock:
+            self.__results = frames
+
+    def submit(self, frames, loop_frame):
+        """
+        Starts the optimization of frames copies, returns False if the previous optimization isn't applied yet
+        """
+        if self.busy or loop_frame is None:
+            return False
+        frames_copies = [copy_frame(frame) for frame in frames]
+        self.__last_pose = get_pose_matrix(frames[-1]) if len(frames) > 0 else None
+        self.__progress = (0, 0.)
+        self.__thread = threading.Thread(target=self.__optimize, args=(frames_copies, copy_frame(loop_frame)),
+                                         daemon=True)
+        self.__thread.start()
+        return True
+
+    def apply_results(self, frames):
+        """
+        Updates frames poses with finished optimization results, returns True if poses were changed.
+        Frames added after the optimization start are moved together with the last optimized frame.
+        """
+        with self.__lock:
+            results = self.__results
+            self.__results = None
+        if results is None:
+            return False
+        self.__thread.join()
+        self.__thread = None
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise error
+
+        num_optimized = len(results)
+        if len(frames) > num_optimized > 0:
+            correction = get_pose_matrix(results[-1]) @ np.linalg.inv(self.__last_pose)
+            for frame in frames[num_optimized:]:
+                tr = correction @ get_pose_matrix(frame)
+                frame.rotation = frame.rotation.copy()
+                frame.rotation[:2, :2] = tr[:2, :2]
+                frame.position = frame.position.copy()
+                frame.position[:2] = tr[:2, 2]
+        for frame, result in zip(frames, results):
+            frame.position = result.position
+            frame.rotation = result.rotation
+        return True
+
+    def wait(self, frames):
+        """
+        Waits for the optimization end and applies its results
+        """
+        if self.__thread is not None:
+            self.__thread.join()
+        return self.apply_results(frames)
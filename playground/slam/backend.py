@@ -1,23 +1,42 @@
 import time
 
-from playground.slam.frame import Frame
+from playground.slam.frame import Frame, get_relative_odometry
 from playground.slam.posegraph import PoseGraph
 
 
 class BackEnd:
-    def __init__(self, edge_sigma, angle_sigma):
+    def __init__(self, edge_sigma, angle_sigma, incremental=False, extra_edges=False, odometry_edges=False,
+                 odometry_sigma=3., odometry_angle_sigma=0.3):
         self.__pose_graph = PoseGraph(edge_sigma_x=edge_sigma, edge_sigma_y=edge_sigma,
-                                      edge_sigma_angle=angle_sigma)
+                                      edge_sigma_angle=angle_sigma,
+                                      odometry_sigma_x=odometry_sigma, odometry_sigma_y=odometry_sigma,
+                                      odometry_sigma_angle=odometry_angle_sigma,
+                                      relinearize_threshold=0.01 if incremental else 0.)
+        # in the incremental mode the graph is kept between updates and only new frames are added,
+        # the optimization is warm started and factors are relinearized only when their vertices move
+        self.__incremental = incremental
+        # alignments of frames with older key frames are added as edges too
+        self.__extra_edges = extra_edges
+        # odometry motions between frames are added as separate edges with the odometry noise
+        self.__odometry_edges = odometry_edges
+        self.__num_frames = 0  # number of frames already added to the graph
+        self.__loop_edges = set()  # (frame index, reference frame index) pairs of loop edges in the graph
 
-    def update_frames(self, frames: list[Frame], loop_frame: Frame):
+    def update_frames(self, frames: list[Frame], loop_frame: Frame, progress_callback=None):
         """
-        Optimize pose graph and update frame positions with an assumption that we've detected a loop closure
+        Optimize pose graph and update frame positions with an assumption that we've detected a loop closure,
+        the optional progress_callback(iteration, error) is called after every optimization iteration
         """
         start_time = time.perf_counter()
         print('Pose Graph optimization started...')
-        self.__pose_graph.clear()
-        vertex_index = self.__pose_graph.prior_pose_index + 1
-        for frame in frames:
+        if not self.__incremental or self.__num_frames > len(frames):
+            self.__pose_graph.clear()
+            self.__num_frames = 0
+            self.__loop_edges.clear()
+        has_new_edges = self.__num_frames < len(frames)
+        vertex_index = self.__pose_graph.prior_pose_index + 1 + self.__num_frames
+        for frame_index in range(self.__num_frames, len(frames)):
+            frame = frames[frame_index]
             ty = frame.position[0]
             tx = frame.position[1]
             rot = frame.rotation[:2, :2]
@@ -27,21 +46,42 @@ class BackEnd:
             edge_tx = frame.relative_icp_position[0]
             edge_rot = frame.relative_icp_rotation[:2, :2]
             self.__pose_graph.add_factor_edge(vertex_index - 1, vertex_index, edge_ty, edge_tx, edge_rot.T)
+            if self.__extra_edges:
+                # the frame was aligned with older key frames too
+                for reference_index, edge_position, edge_rotation in frame.extra_edges:
+                    self.__pose_graph.add_factor_edge(self.__pose_graph.prior_pose_index + 1 + reference_index,
+                                                      vertex_index, edge_position[1], edge_position[0],
+                                                      edge_rotation[:2, :2].T)
+            odometry = get_relative_odometry(frame, frames[frame_index - 1]) if self.__odometry_edges and \
+                frame_index > 0 else None
+            if odometry is not None:
+                odometry_rot, odometry_pos = odometry
+                self.__pose_graph.add_odometry_edge(vertex_index - 1, vertex_index, odometry_pos[1], odometry_pos[0],
+                                                    odometry_rot[:2, :2].T)
             vertex_index += 1
+        self.__num_frames = len(frames)
 
         # add the loop closure constraint
         # This factor encodes the fact that we have returned to the same pose. In real
         # systems, these constraints may be identified in many ways, such as appearance-based
         # techniques with camera images.
 
-        loop_ty = loop_frame.relative_icp_position[1]
-        loop_tx = loop_frame.relative_icp_position[0]
-        loop_rot = loop_frame.relative_icp_rotation[:2, :2]
-        self.__pose_graph.add_factor_edge(vertex_index - 1,
-                                          self.__pose_graph.prior_pose_index + 1,
-                                          loop_ty, loop_tx, loop_rot.T)
+        # the same loop closure is added once in the incremental mode
+        loop_edge = len(frames) - 1, loop_frame.reference_index
+        if loop_edge not in self.__loop_edges:
+            loop_ty = loop_frame.relative_icp_position[1]
+            loop_tx = loop_frame.relative_icp_position[0]
+            loop_rot = loop_frame.relative_icp_rotation[:2, :2]
+            self.__pose_graph.add_factor_edge(vertex_index - 1,
+                                              self.__pose_graph.prior_pose_index + 1 + loop_frame.reference_index,
+                                              loop_ty, loop_tx, loop_rot.T)
+            self.__loop_edges.add(loop_edge)
+            has_new_edges = True
 
-        self.__pose_graph.optimize()
+        # in the incremental mode optimization is warm started from the previous solution,
+        # without new edges the graph is already optimized
+        if has_new_edges:
+            self.__pose_graph.optimize(progress_callback=progress_callback)
 
         vertex_index = self.__pose_graph.prior_pose_index + 1
         for frame in frames:
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def sort_ids(ids):
+    """
+    Prepares ids for the correspondences search, returns sorted ids and their original indices
+    """
+    order = np.argsort(ids, kind='stable')
+    return ids[order], order
+
+
+def find_id_correspondences(ids_a, sorted_ids_b, order_b, max_distance=5):
+    """
+    Matches every id from ids_a with the nearest id from the sorted ids_b.
+    Every point b can be matched only once with the first point from a which is nearest to it,
+    matches with distance greater than max_distance are removed.
+    Returns indices of matched points in a and b.
+    """
+    if ids_a.shape[0] == 0 or sorted_ids_b.shape[0] == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    # the nearest id is one of the neighbours of the insertion position
+    right = np.searchsorted(sorted_ids_b, ids_a)
+    left = np.maximum(right - 1, 0)
+    # take the first one of the equal ids
+    left = np.searchsorted(sorted_ids_b, sorted_ids_b[left])
+    right = np.minimum(right, sorted_ids_b.shape[0] - 1)
+    left_distances = np.abs(ids_a - sorted_ids_b[left])
+    right_distances = np.abs(sorted_ids_b[right] - ids_a)
+    use_left = left_distances <= right_distances
+    nearest = np.where(use_left, left, right)
+    distances = np.where(use_left, left_distances, right_distances)
+
+    # only the first point from a which is matched to the point b can use it
+    _, first_a = np.unique(nearest, return_index=True)
+    first_a = first_a[distances[first_a] <= max_distance]
+    first_a.sort()
+    return first_a, order_b[nearest[first_a]]
@@ -1,4 +1,8 @@
 import numpy as np
+from scipy.spatial import cKDTree
+
+from playground.slam.correspondence import sort_ids
+from playground.slam.icp import estimate_normals
 
 
 class Frame:
@@ -7,7 +11,14 @@ class Frame:
         self.rotation = np.identity(3)
         self.relative_icp_position = np.array([0., 0., 0.])  # relative to the previous frame
         self.relative_icp_rotation = np.identity(3)  # relative to the previous frame
+        self.reference_index = None  # index of the frame the loop closure pose is relative to
+        self.extra_edges = []  # (frame index, relative position, relative rotation) for older key frames
+        self.odometry_position = None  # the odometry pose when the scan was taken, None without odometry
+        self.odometry_rotation = None
         self.__observed_points = observed_points
+        self.__kd_tree = None
+        self.__normals = None
+        self.__sorted_ids = None
 
     @property
     def transform(self):
@@ -20,3 +31,36 @@ class Frame:
     @property
     def observed_points(self):
         return self.__observed_points
+
+    @property
+    def kd_tree(self):
+        # spatial index over the observed points, it's built once on the first alignment against this frame
+        if self.__kd_tree is None:
+            self.__kd_tree = cKDTree(self.__observed_points[:, :2].astype(float))
+        return self.__kd_tree
+
+    @property
+    def normals(self):
+        if self.__normals is None:
+            self.__normals = estimate_normals(self.kd_tree)
+        return self.__normals
+
+    @property
+    def sorted_ids(self):
+        # sorted point ids with their indices, they are prepared once for the correspondences search
+        if self.__sorted_ids is None:
+            self.__sorted_ids = sort_ids(self.__observed_points[:, 2])
+        return self.__sorted_ids
+
+
+def get_relative_odometry(frame, reference_frame):
+    """
+    Odometry motion from the reference frame to the frame as the (rotation, position) pair in the same form
+    as the ICP result, None if any of frames has no odometry
+    """
+    if frame.odometry_position is None or reference_frame.odometry_position is None:
+        return None
+    rot = frame.odometry_rotation @ reference_frame.odometry_rotation.T
+    pos = reference_frame.odometry_rotation[:2, :2].T @ (frame.odometry_position[:2] -
+                                                         reference_frame.odometry_position[:2])
+    return rot, pos
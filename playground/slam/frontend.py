@@ -1,10 +1,11 @@
 import numpy as np
 import pygame
 from skimage.draw import line_aa
-from sklearn.neighbors import NearestNeighbors
 
-from playground.slam.frame import Frame
+from playground.slam.correspondence import find_id_correspondences
+from playground.slam.frame import Frame, get_relative_odometry
 from playground.slam.icp import ICP
+from playground.utils.tiledmap import TiledMap
 from playground.utils.transform import to_screen_coords, transform_points
 
 
@@ -13,123 +14,295 @@ class FrontEnd:
     Takes raw sensor data and construct graph
     """
 
-    def __init__(self, world_h, world_w):
+    def __init__(self, world_h, world_w, use_point_ids=True, key_frame_policy=None, loop_detector=None,
+                 min_loop_overlap=0.5, last_num_to_check=1, scan_matcher=None):
         self.__h = world_h
         self.__w = world_w
-        self.__local_map = np.full((world_h, world_w), 255, dtype=np.uint8)
+        # point ids come from the simulator, without them correspondences are found with nearest neighbours
+        self.__use_point_ids = use_point_ids
+        # number of frames drawn into every map pixel, frames are drawn incrementally,
+        # the map isn't limited by the world size and only tiles touched by frames are allocated,
+        # the local map image is a window of it
+        self.__map_hits = TiledMap(dtype=np.int32)
+        self.__drawn_pixels = []  # map pixels drawn for every frame
+        self.__drawn_positions = np.empty((0, 3))  # frame poses used for drawing
+        self.__drawn_rotations = np.empty((0, 3, 3))
 
-        self.__last_num_to_check = 2  # number of last key-frames to try align current one
+        # number of last key-frames to try align current one, every extra key frame adds an alignment per step
+        self.__last_num_to_check = last_num_to_check
         self.__frame_align_error = 10  # distance in pixels
         self.__icp = ICP()
+        # the scan matcher gives the initial guess for the ICP, without it the ICP starts from the odometry motion
+        # or from the key frame pose if there is no odometry, the ICP with point ids doesn't need the guess
+        self.__scan_matcher = scan_matcher if not use_point_ids else None
         self.__frames = []
-        self.__knn = NearestNeighbors(n_neighbors=1)
+        # without the policy every aligned frame becomes a key frame
+        self.__key_frame_policy = key_frame_policy
+        self.__tracked_frame = None  # the last aligned frame which isn't a key frame
+        # without the detector loop closures are only created with the create_loop_closure call
+        self.__loop_detector = loop_detector
+        self.__min_loop_overlap = min_loop_overlap  # ratio of loop frame points which are near to the candidate
+        self.__overlap_distance = 5 if key_frame_policy is None else key_frame_policy.overlap_distance
 
     def __find_frames_correspondences(self, frame_a, frame_b, min_dist=5):
         ids_a = frame_a.observed_points[:, 2]
-        ids_a = ids_a.reshape((-1, 1))
-        ids_b = frame_b.observed_points[:, 2]
-        ids_b = ids_b.reshape((-1, 1))
-        estimator = self.__knn.fit(ids_b)
-        distances, indices = estimator.kneighbors(ids_a, return_distance=True)
-        # remove outliers
-        idx_a = []
-        idx_b = []
-        used_ids = set()
-        for d, i_b, i_a in zip(distances, indices.reshape((-1)).tolist(), range(ids_a.shape[0])):
-            if i_b not in used_ids:
-                if d <= min_dist:
-                    idx_a.append(i_a)
-                    idx_b.append(i_b)
-            used_ids.add(i_b)
-        return idx_a, idx_b
-
-    def add_key_frame(self, sensor):
-        frame_candidate = self.create_new_frame(sensor)
+        sorted_ids_b, order_b = frame_b.sorted_ids
+        return find_id_correspondences(ids_a, sorted_ids_b, order_b, max_distance=min_dist)
+
+    def __get_overlap(self, frame_candidate, key_frame):
+        """
+        Ratio of the aligned frame points which have a key frame point nearby
+        """
+        points = transform_points(frame_candidate.observed_points[:, :2], frame_candidate.relative_icp_rotation,
+                                  target_type=float)
+        points += frame_candidate.relative_icp_position[:2]
+        distances, _ = key_frame.kd_tree.query(points, distance_upper_bound=self.__overlap_distance)
+        return np.mean(np.isfinite(distances))
+
+    def add_key_frame(self, sensor, odometry=None):
+        """
+        Aligns the sensor scan with the last key frames, returns True if the scan was added as a new key frame.
+        The optional odometry pose is the initial guess of the alignment and is kept for the back end edges.
+        """
+        frame_candidate = self.create_new_frame(sensor, odometry)
         if frame_candidate:
             if len(self.__frames) > 0:
-                # align current frame with the last one
+                # align current frame with the last ones
                 key_frame = self.__frames[-1]
-                if not self.align_new_frame(frame_candidate, key_frame):
+                if not self.__align_with_last_frames(frame_candidate):
                     print('Failed to align frame"')
                     return False
+                if self.__key_frame_policy is not None:
+                    overlap = self.__get_overlap(frame_candidate, key_frame)
+                    if not self.__key_frame_policy.is_key_frame(frame_candidate.relative_icp_position,
+                                                                frame_candidate.relative_icp_rotation, overlap):
+                        # the frame is only tracked
+                        self.__tracked_frame = frame_candidate
+                        return False
             self.__frames.append(frame_candidate)
+            self.__tracked_frame = None
             return True
         else:
             return False
 
+    @property
+    def current_frame(self):
+        """
+        The last aligned frame, it may be not a key frame
+        """
+        if self.__tracked_frame is not None:
+            return self.__tracked_frame
+        return self.__frames[-1] if len(self.__frames) > 0 else None
+
     def create_loop_closure(self, sensor):
+        """
+        Aligns the sensor scan with the first key frame, the loop closure edge starts at the last key frame
+        so the tracked frame at the current pose becomes a key frame
+        """
+        if self.__tracked_frame is not None:
+            self.__frames.append(self.__tracked_frame)
+            self.__tracked_frame = None
         frame_candidate = self.create_new_frame(sensor)
         if frame_candidate:
             if len(self.__frames) > 0:
                 # align current frame with the first one
                 key_frame = self.__frames[0]
                 if self.align_new_frame(frame_candidate, key_frame):
+                    frame_candidate.reference_index = 0
                     return frame_candidate
                 else:
                     print('Failed to align frame"')
         return None
 
-    def align_new_frame(self, frame_candidate, key_frame):
-        idx_a, idx_b = self.__find_frames_correspondences(frame_candidate, key_frame)
-        points_a = frame_candidate.observed_points[idx_a, :2]
-        points_b = key_frame.observed_points[idx_b, :2]
-        rot, pos, align_error = self.__icp.find_transform(points_a, points_b)
+    def detect_loop_closure(self):
+        """
+        Searches old key frames with scans similar to the last key frame one and aligns it with them,
+        returns the loop closure frame for the first verified candidate or None
+        """
+        if self.__loop_detector is None or len(self.__frames) == 0:
+            return None
+        # frames appended since the last call are described in their order
+        for frame in self.__frames[self.__loop_detector.num_frames:-1]:
+            self.__loop_detector.add_frame(frame.observed_points[:, :2])
+        if self.__loop_detector.num_frames == len(self.__frames):
+            return None
+        last_index = len(self.__frames) - 1
+        last_frame = self.__frames[last_index]
+        for candidate_index in self.__loop_detector.add_frame(last_frame.observed_points[:, :2]):
+            key_frame = self.__frames[candidate_index]
+            loop_frame = Frame(last_frame.observed_points)
+            if self.align_new_frame(loop_frame, key_frame) and \
+                    self.__get_overlap(loop_frame, key_frame) >= self.__min_loop_overlap:
+                loop_frame.reference_index = candidate_index
+                self.__loop_detector.confirm_loop_closure(last_index)
+                return loop_frame
+        return None
 
+    def __find_alignment(self, frame_candidate, key_frame, initial_guess=None):
+        """
+        Returns the candidate rotation and position relative to the key frame with the alignment error,
+        or None if scans can't be aligned. The scan matcher searches around the given initial guess
+        and its result replaces the guess.
+        """
+        if self.__scan_matcher is not None:
+            rot, pos, _ = self.__scan_matcher.match(frame_candidate.observed_points[:, :2], key_frame,
+                                                    initial_guess=initial_guess)
+            initial_guess = rot, pos
+        if self.__use_point_ids:
+            idx_a, idx_b = self.__find_frames_correspondences(frame_candidate, key_frame)
+            points_a = frame_candidate.observed_points[idx_a, :2]
+            points_b = key_frame.observed_points[idx_b, :2]
+            if points_a.shape[0] == 0:
+                # scans don't have common points
+                return None
+            rot, pos, align_error = self.__icp.find_transform(points_a, points_b, initial_guess=initial_guess)
+        else:
+            points_a = frame_candidate.observed_points[:, :2]
+            rot, pos, align_error = self.__icp.find_nearest_transform(points_a, key_frame.kd_tree, key_frame.normals,
+                                                                      initial_guess=initial_guess)
         if align_error <= self.__frame_align_error:
-            frame_candidate.rotation = rot @ key_frame.rotation  # initial guess
+            return rot, pos, align_error
+        return None
+
+    @staticmethod
+    def __set_relative_pose(frame_candidate, key_frame, rot, pos):
+        frame_candidate.rotation = rot @ key_frame.rotation  # initial guess
+
+        # the relative position is measured in the key frame coordinate system
+        frame_candidate.position[:2] = pos
+        frame_candidate.position = key_frame.rotation @ frame_candidate.position
+        frame_candidate.position += key_frame.position  # initial guess
+
+        frame_candidate.relative_icp_position = pos
+        frame_candidate.relative_icp_rotation = rot
+
+    def align_new_frame(self, frame_candidate, key_frame):
+        alignment = self.__find_alignment(frame_candidate, key_frame)
+        if alignment is None:
+            return False
+        rot, pos, _ = alignment
+        self.__set_relative_pose(frame_candidate, key_frame, rot, pos)
+        return True
 
-            frame_candidate.position[:2] = pos
-            frame_candidate.position = frame_candidate.rotation @ frame_candidate.position
-            frame_candidate.position += key_frame.position  # initial guess
+    def __align_with_last_frames(self, frame_candidate):
+        """
+        Aligns the candidate with the last key frames, the pose comes from the alignment with the smallest error,
+        alignments with older key frames become extra edges. The relative pose to the last key frame is computed
+        from poses if the alignment with it failed.
+        """
+        window = self.__frames[-self.__last_num_to_check:]
+        first_index = len(self.__frames) - len(window)
+        alignments = [self.__find_alignment(frame_candidate, key_frame,
+                                            get_relative_odometry(frame_candidate, key_frame))
+                      for key_frame in window]
+        aligned = [index for index, alignment in enumerate(alignments) if alignment is not None]
+        if len(aligned) == 0:
+            return False
 
+        best = min(aligned, key=lambda index: alignments[index][2])
+        rot, pos, _ = alignments[best]
+        self.__set_relative_pose(frame_candidate, window[best], rot, pos)
+        last = len(window) - 1
+        if best != last:
+            if alignments[last] is not None:
+                rot, pos, _ = alignments[last]
+            else:
+                rot = frame_candidate.rotation @ window[last].rotation.T
+                pos = (window[last].rotation.T @ (frame_candidate.position - window[last].position))[:2]
             frame_candidate.relative_icp_position = pos
             frame_candidate.relative_icp_rotation = rot
-            return True
-        else:
-            return False
+        frame_candidate.extra_edges = [(first_index + index, alignments[index][1], alignments[index][0])
+                                       for index in aligned if index != last]
+        return True
 
-    def create_new_frame(self, sensor):
+    def create_new_frame(self, sensor, odometry=None):
         obstacles = sensor.get_obstacles()
         if obstacles is not None:
-            return Frame(obstacles.copy())
+            frame = Frame(obstacles.copy())
+            if odometry is not None:
+                frame.odometry_position = odometry.position.copy()
+                frame.odometry_rotation = odometry.rotation.copy()
+            return frame
         return None
 
+    def __get_frame_pixels(self, index):
+        """
+        Rasterizes frame points and the path segment from the previous frame into unique map pixels
+        """
+        frame = self.__frames[index]
+        position = np.array(to_screen_coords(self.__h, self.__w, frame.position[:2], clip=False)).astype(int)
+        if index > 0:
+            prev_pos = to_screen_coords(self.__h, self.__w, self.__frames[index - 1].position[:2], clip=False)
+            prev_pos = np.array(prev_pos).astype(int)
+            rr, cc, _ = line_aa(prev_pos[1], prev_pos[0], position[1], position[0])
+        else:
+            rr, cc = np.array([position[1]]), np.array([position[0]])
+
+        # move points into the world coordinate system
+        points = frame.observed_points[:, :2]
+        points = transform_points(points, frame.rotation, target_type=float)
+        points += frame.position[:2]
+        points = points.astype(int)
+
+        # convert them into map coordinate system
+        points[:, 0] = self.__h // 2 - points[:, 0]
+        points[:, 1] += self.__w // 2
+
+        rows = np.concatenate([rr, points[:, 0]])
+        cols = np.concatenate([cc, points[:, 1]])
+        min_row, min_col = rows.min(), cols.min()
+        num_cols = cols.max() - min_col + 1
+        keys = np.unique((rows - min_row) * num_cols + (cols - min_col))
+        return np.stack([keys // num_cols + min_row, keys % num_cols + min_col], axis=1)
+
     def generate_local_map(self):
         """
-            Combines frames into local map
-        """
-        # Clear the occupancy map
-        self.__local_map = np.full((self.__h, self.__w), 255, dtype=np.uint8)
-        prev_pos = None
-        for frame in self.__frames:
-            # draw position
-            position = to_screen_coords(self.__h, self.__w, frame.position[:2])
-            if prev_pos is not None:
-                rr, cc, _ = line_aa(prev_pos[1], prev_pos[0], position[1], position[0])
-                rr = np.clip(rr, 0, self.__h - 1)
-                cc = np.clip(cc, 0, self.__w - 1)
-                self.__local_map[rr, cc] = 0
+            Combines frames into local map, only new frames and frames which poses were changed are redrawn
+        """
+        num_frames = len(self.__frames)
+        num_drawn = len(self.__drawn_pixels)
+        if num_drawn > num_frames:
+            # frames were removed, start from the empty map
+            self.__map_hits.clear()
+            self.__drawn_pixels = []
+            num_drawn = 0
+        if num_frames == 0:
+            return
+
+        positions = np.array([frame.position for frame in self.__frames])
+        rotations = np.array([frame.rotation for frame in self.__frames])
+        moved = np.any(positions[:num_drawn] != self.__drawn_positions[:num_drawn], axis=1)
+        moved |= np.any(rotations[:num_drawn] != self.__drawn_rotations[:num_drawn], axis=(1, 2))
+        moved = np.flatnonzero(moved)
+        # the path segment of the next frame starts at the moved frame
+        to_draw = np.union1d(np.union1d(moved, moved + 1), np.arange(num_drawn, num_frames))
+        to_draw = to_draw[to_draw < num_frames]
+        if to_draw.shape[0] == 0:
+            return
+
+        for index in to_draw:
+            if index < num_drawn:
+                self.__map_hits.add(self.__drawn_pixels[index], -1)
+            pixels = self.__get_frame_pixels(index)
+            self.__map_hits.add(pixels, 1)
+            if index < num_drawn:
+                self.__drawn_pixels[index] = pixels
             else:
-                self.__local_map[position[1], position[0]] = 0
-            prev_pos = position
-
-            # move points into the world coordinate system
-            points = frame.observed_points[:, :2]
-            points = transform_points(points, frame.rotation, target_type=float)
-            points += frame.position[:2]
-            points = points.astype(int)
-
-            # convert them into map coordinate system
-            points[:, 0] = self.__h // 2 - points[:, 0]
-            points[:, 1] += self.__w // 2
-            points = np.clip(points, [0, 0],
-                             [self.__h - 1, self.__w - 1])
-            # draw
-            self.__local_map[points[:, 0], points[:, 1]] = 0
+                self.__drawn_pixels.append(pixels)
+        self.__drawn_positions = positions
+        self.__drawn_rotations = rotations
 
-    def draw(self, screen, offset):
+    @property
+    def local_map(self):
+        """
+        Image of the world size window of the map, it's built from the map tiles on every call
+        """
         self.generate_local_map()
-        transposed_map = np.transpose(self.__local_map)
+        hits = self.__map_hits.get_window(0, 0, self.__h, self.__w)
+        return np.where(hits > 0, 0, 255).astype(np.uint8)
+
+    def draw(self, screen, offset):
+        transposed_map = np.transpose(self.local_map)
         surf = pygame.surfarray.make_surface(transposed_map)
         screen.blit(surf, (offset, 0))
 
@@ -1,19 +1,36 @@
-from playground.slam.frame import Frame
+from playground.slam.frame import Frame, get_relative_odometry
 from playground.slam.gtsamposegraph import GTSAMPoseGraph
 
 
 class GTSAMBackEnd:
-    def __init__(self, edge_sigma, angle_sigma):
+    def __init__(self, edge_sigma, angle_sigma, incremental=False, extra_edges=False, odometry_edges=False,
+                 odometry_sigma=3., odometry_angle_sigma=0.3):
+        # in the incremental mode the graph is kept between updates and only new frames are added
         self.__pose_graph = GTSAMPoseGraph(edge_sigma_x=edge_sigma, edge_sigma_y=edge_sigma,
-                                           edge_sigma_angle=angle_sigma)
+                                           edge_sigma_angle=angle_sigma, incremental=incremental,
+                                           odometry_sigma_x=odometry_sigma, odometry_sigma_y=odometry_sigma,
+                                           odometry_sigma_angle=odometry_angle_sigma)
+        self.__incremental = incremental
+        # alignments of frames with older key frames are added as edges too
+        self.__extra_edges = extra_edges
+        # odometry motions between frames are added as separate edges with the odometry noise
+        self.__odometry_edges = odometry_edges
+        self.__num_frames = 1  # number of frames already added to the graph, the first one is the prior
+        self.__loop_edges = set()  # (frame index, reference frame index) pairs of loop edges in the graph
 
-    def update_frames(self, frames: list[Frame], loop_frame: Frame):
+    def update_frames(self, frames: list[Frame], loop_frame: Frame, progress_callback=None):
         """
-        Optimize pose graph and update frame positions with an assumption that we've detected a loop closure
+        Optimize pose graph and update frame positions with an assumption that we've detected a loop closure,
+        the optional progress_callback(iteration, error) is called after every optimization iteration
         """
-        self.__pose_graph.clear()
-        vertex_index = self.__pose_graph.prior_pose_index + 1
-        for frame in frames[1:]:
+        if not self.__incremental or self.__num_frames > len(frames):
+            self.__pose_graph.clear()
+            self.__num_frames = 1
+            self.__loop_edges.clear()
+        has_new_edges = self.__num_frames < len(frames)
+        vertex_index = self.__pose_graph.prior_pose_index + self.__num_frames
+        for frame_index in range(self.__num_frames, len(frames)):
+            frame = frames[frame_index]
             ty = frame.position[0]
             tx = frame.position[1]
             rot = frame.rotation[:2, :2]
@@ -23,20 +40,39 @@ class GTSAMBackEnd:
             edge_tx = frame.relative_icp_position[0]
             edge_rot = frame.relative_icp_rotation[:2, :2]
             self.__pose_graph.add_factor_edge(vertex_index - 1, vertex_index, edge_tx, edge_ty, edge_rot)
+            if self.__extra_edges:
+                # the frame was aligned with older key frames too
+                for reference_index, edge_position, edge_rotation in frame.extra_edges:
+                    self.__pose_graph.add_factor_edge(self.__pose_graph.prior_pose_index + reference_index,
+                                                      vertex_index, edge_position[0], edge_position[1],
+                                                      edge_rotation[:2, :2])
+            odometry = get_relative_odometry(frame, frames[frame_index - 1]) if self.__odometry_edges else None
+            if odometry is not None:
+                odometry_rot, odometry_pos = odometry
+                self.__pose_graph.add_odometry_edge(vertex_index - 1, vertex_index, odometry_pos[0], odometry_pos[1],
+                                                    odometry_rot[:2, :2])
             vertex_index += 1
+        self.__num_frames = max(len(frames), 1)
 
         # add the loop closure constraint
         # This factor encodes the fact that we have returned to the same pose. In real
         # systems, these constraints may be identified in many ways, such as appearance-based
         # techniques with camera images.
-        loop_ty = loop_frame.relative_icp_position[1]
-        loop_tx = loop_frame.relative_icp_position[0]
-        loop_rot = loop_frame.relative_icp_rotation[:2, :2]
-        self.__pose_graph.add_factor_edge(vertex_index - 1,
-                                          self.__pose_graph.prior_pose_index + 1,
-                                          loop_tx, loop_ty, loop_rot)
+        # the same loop closure is added once in the incremental mode
+        loop_edge = len(frames) - 1, loop_frame.reference_index
+        if loop_edge not in self.__loop_edges:
+            loop_ty = loop_frame.relative_icp_position[1]
+            loop_tx = loop_frame.relative_icp_position[0]
+            loop_rot = loop_frame.relative_icp_rotation[:2, :2]
+            self.__pose_graph.add_factor_edge(vertex_index - 1,
+                                              self.__pose_graph.prior_pose_index + loop_frame.reference_index,
+                                              loop_tx, loop_ty, loop_rot)
+            self.__loop_edges.add(loop_edge)
+            has_new_edges = True
 
-        self.__pose_graph.optimize()
+        # without new edges the graph is already optimized
+        if has_new_edges:
+            self.__pose_graph.optimize(progress_callback=progress_callback)
 
         vertex_index = 0
         for frame in frames:
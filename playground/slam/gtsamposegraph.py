@@ -3,19 +3,33 @@ import numpy as np
 
 
 class GTSAMPoseGraph:
-    def __init__(self, edge_sigma_x, edge_sigma_y, edge_sigma_angle):
+    def __init__(self, edge_sigma_x, edge_sigma_y, edge_sigma_angle, incremental=False, odometry_sigma_x=3.,
+                 odometry_sigma_y=3., odometry_sigma_angle=0.3):
         self.__sigma_x = 0.1
         self.__sigma_y = 0.1
         self.__sigma_theta = 0.05
         self.__prior_pose_index = 0
-        self.__isam2 = gtsam.ISAM2()
+        # in the incremental mode the graph and values keep only new elements which weren't passed to iSAM2 yet
+        self.__incremental = incremental
+        self.__num_isam2_iterations = 3
+        self.__isam2 = self.__create_isam2()
         self.__graph = gtsam.NonlinearFactorGraph()
         self.__values = gtsam.Values()
         self.__edge_noise_model = gtsam.noiseModel.Diagonal.Sigmas(
             np.array([edge_sigma_x, edge_sigma_y, edge_sigma_angle]))
+        # odometry edges have own noise model, odometry errors don't depend on scans
+        self.__odometry_noise_model = gtsam.noiseModel.Diagonal.Sigmas(
+            np.array([odometry_sigma_x, odometry_sigma_y, odometry_sigma_angle]))
         self.define_prior()
         self.__optimization_result = None
 
+    @staticmethod
+    def __create_isam2():
+        parameters = gtsam.ISAM2Params()
+        parameters.setRelinearizeThreshold(0.01)
+        parameters.relinearizeSkip = 1
+        return gtsam.ISAM2(parameters)
+
     def define_prior(self):
         prior_model = gtsam.noiseModel.Diagonal.Sigmas(np.array([self.__sigma_x, self.__sigma_y, self.__sigma_theta]))
         prior_pose = gtsam.Pose2(0, 0, 0)
@@ -37,25 +51,61 @@ class GTSAMPoseGraph:
         pose = gtsam.Pose2(rot2, np.array([tx, ty]))
         self.__values.insert(index, pose)
 
-    def add_factor_edge(self, vertex_index_a, vertex_index_b, tx, ty, rot):
+    def add_factor_edge(self, vertex_index_a, vertex_index_b, tx, ty, rot, noise_model=None):
+        if noise_model is None:
+            noise_model = self.__edge_noise_model
         rot2 = gtsam.Rot2()
         rot2 = rot2.fromCosSin(rot[0, 0], rot[1, 0])
         pose = gtsam.Pose2(rot2, np.array([tx, ty]))
-        factor = gtsam.BetweenFactorPose2(vertex_index_a, vertex_index_b, pose, self.__edge_noise_model)
+        factor = gtsam.BetweenFactorPose2(vertex_index_a, vertex_index_b, pose, noise_model)
         self.__graph.add(factor)
 
+    def add_odometry_edge(self, vertex_index_a, vertex_index_b, tx, ty, rot):
+        self.add_factor_edge(vertex_index_a, vertex_index_b, tx, ty, rot, noise_model=self.__odometry_noise_model)
+
     def clear(self):
         self.__optimization_result = None
+        self.__isam2 = self.__create_isam2()
         self.__graph.resize(0)
         self.__values.clear()
         self.define_prior()
 
-    def optimize(self, tolerance=1e-5, max_iterations=100):
+    def optimize(self, tolerance=1e-5, max_iterations=100, progress_callback=None):
+        """
+        Optimizes the graph, the optional progress_callback(iteration, error) is called after every iteration
+        """
+        if self.__incremental:
+            # only new factors are linearized, old ones are relinearized if their estimates moved,
+            # extra updates without new factors let a loop closure converge
+            self.__isam2.update(self.__graph, self.__values)
+            for iteration in range(self.__num_isam2_iterations):
+                self.__isam2.update()
+                if progress_callback is not None:
+                    estimate = self.__isam2.calculateEstimate()
+                    progress_callback(iteration + 1, self.__isam2.getFactorsUnsafe().error(estimate))
+            self.__optimization_result = self.__isam2.calculateEstimate()
+            self.__graph.resize(0)
+            self.__values.clear()
+            return
+
         parameters = gtsam.GaussNewtonParams()
         parameters.setRelativeErrorTol(tolerance)
         parameters.setMaxIterations(max_iterations)
         optimizer = gtsam.GaussNewtonOptimizer(self.__graph, self.__values, parameters)
-        self.__optimization_result = optimizer.optimize()
+        if progress_callback is None:
+            self.__optimization_result = optimizer.optimize()
+            return
+
+        # iterate manually to report the progress
+        error = optimizer.error()
+        for iteration in range(max_iterations):
+            optimizer.iterate()
+            new_error = optimizer.error()
+            progress_callback(iteration + 1, new_error)
+            if error - new_error <= tolerance * error:
+                break
+            error = new_error
+        self.__optimization_result = optimizer.values()
 
     def get_pose_at(self, index):
         assert (self.__optimization_result is not None)
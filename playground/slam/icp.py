@@ -1,7 +1,22 @@
 import math
 import numpy as np
 
-from playground.utils.transform import create_rotation_matrix_yx, create_rotation_matrix_2xy
+from playground.utils.transform import create_rotation_matrix_yx, create_rotation_matrix_2xy, transform_points
+
+
+def estimate_normals(kd_tree, num_neighbours=5):
+    """
+    Estimates unit normals of the points in the kd_tree with the PCA of their neighbourhoods
+    """
+    points = kd_tree.data
+    num_neighbours = min(num_neighbours, points.shape[0])
+    _, indices = kd_tree.query(points, k=num_neighbours)
+    neighbours = points[indices.reshape((points.shape[0], -1))]
+    neighbours = neighbours - np.mean(neighbours, axis=1, keepdims=True)
+    covariances = np.einsum('nki,nkj->nij', neighbours, neighbours)
+    # eigenvalues are sorted in the ascending order, so the first eigenvector is the normal
+    _, eigenvectors = np.linalg.eigh(covariances)
+    return eigenvectors[:, :, 0]
 
 
 class ICP:
@@ -9,66 +24,192 @@ class ICP:
         Iterative Closest Point (ICP) implementation
     """
 
-    def __init__(self, max_iterations=20, tolerance=0.001):
+    def __init__(self, max_iterations=20, tolerance=0.001, kernel='huber', kernel_scale=5., trim_ratio=1.):
         self.__max_iterations = max_iterations
-        self.__tolerance = tolerance
-
-    def find_transform(self, points_a, points_b, iterations=100, tolerance=1):
+        self.__tolerance = tolerance  # the parameters update size to stop iterations
+        # robust kernel weights decrease the influence of large residuals, None weighs all residuals equally
+        if kernel not in ('huber', 'cauchy', None):
+            raise ValueError(f'Unknown robust kernel {kernel}')
+        self.__kernel = kernel
+        self.__kernel_scale = kernel_scale  # residual in pixels where the kernel starts to reduce weights
+        self.__trim_ratio = trim_ratio  # ratio of correspondences with the smallest residuals used for the update
+
+    def __get_kernel_weights(self, residuals):
+        if self.__kernel == 'huber':
+            return np.minimum(1., self.__kernel_scale / np.maximum(residuals, 1e-12))
+        if self.__kernel == 'cauchy':
+            return 1. / (1. + (residuals / self.__kernel_scale) ** 2)
+        return np.ones_like(residuals)
+
+    def __get_trimmed_indices(self, distances):
+        num_kept = max(math.ceil(distances.shape[0] * self.__trim_ratio), min(distances.shape[0], 3))
+        if num_kept >= distances.shape[0]:
+            return np.arange(distances.shape[0])
+        return np.argpartition(distances, num_kept - 1)[:num_kept]
+
+    def find_transform(self, points_a, points_b, iterations=None, tolerance=None, initial_guess=None):
+        """
+        Gauss-Newton alignment of known correspondences with robust kernel weights, the worst correspondences
+        are trimmed every iteration. Iterations stop when the parameters update becomes smaller than the tolerance.
+        The optional initial_guess is a (rotation, position) pair in the same form as the result.
+        Returns the rotation, the position and the mean distance between trimmed correspondences.
+        """
+        iterations = self.__max_iterations if iterations is None else iterations
+        tolerance = self.__tolerance if tolerance is None else tolerance
         # swap x - y
-        points_a = points_a[:, ::-1]
-        points_b = points_b[:, ::-1]
+        points_a = points_a[:, ::-1].astype(float)
+        points_b = points_b[:, ::-1].astype(float)
 
         # initial values for tx, ty, angle
         params = np.array([0.0, 0.0, 0.0])
+        if initial_guess is not None:
+            rot, pos = initial_guess
+            params[:2] = pos[:2][::-1]
+            params[2] = math.atan2(rot[0, 1], rot[0, 0])
 
         for i in range(iterations):
-            h_sum = np.zeros((3, 3))
-            b_sum = np.zeros(3)
-
             # modify points with params
             angle = params[2]
             rot = create_rotation_matrix_2xy(angle)
             adjusted_points = points_a.dot(rot.T)
             adjusted_points += params[:2]
+            e = adjusted_points - points_b
+            distances = np.hypot(e[:, 0], e[:, 1])
+
+            # only the best correspondences are used, others are probably mismatched
+            kept = self.__get_trimmed_indices(distances)
+            e = e[kept]
+            weights = self.__get_kernel_weights(distances[kept])
+            kept_a = points_a[kept]
+
+            # Jacobian rows are [1, 0, ja] and [0, 1, jb] for every point
+            ja = -math.sin(angle) * kept_a[:, 0] - math.cos(angle) * kept_a[:, 1]
+            jb = math.cos(angle) * kept_a[:, 0] - math.sin(angle) * kept_a[:, 1]
+
+            # Hessian approximation, the weighted sum of J^T @ J over all points
+            weights_sum = np.sum(weights)
+            wja = weights * ja
+            wjb = weights * jb
+            h_sum = np.array([[weights_sum, 0, np.sum(wja)],
+                              [0, weights_sum, np.sum(wjb)],
+                              [np.sum(wja), np.sum(wjb), np.sum(wja * ja + wjb * jb)]])
+
+            # Right hand side, the weighted sum of J^T @ e over all points
+            b_sum = np.array([np.sum(weights * e[:, 0]), np.sum(weights * e[:, 1]),
+                              np.sum(wja * e[:, 0] + wjb * e[:, 1])])
+
+            try:
+                params_update = -np.linalg.solve(h_sum, b_sum)
+            except np.linalg.LinAlgError:
+                # too few points to find all parameters
+                params_update = -np.linalg.pinv(h_sum) @ b_sum
+            params += params_update
 
             # test if we can stop
-            distances = self.__get_distances(adjusted_points, points_b)
-            mean_error = np.mean(distances)
-            if mean_error < tolerance:
+            if np.linalg.norm(params_update[:2]) < tolerance and abs(params_update[2]) < tolerance:
                 break
 
-            for pa, pb, pm in zip(points_a, points_b, adjusted_points):
-                # Jacobian
-                j = np.array([[1, 0, -math.sin(angle) * pa[0] - math.cos(angle) * pa[1]],
-                              [0, 1, math.cos(angle) * pa[0] - math.sin(angle) * pa[1]]])
+        # Calculate an error
+        rot = create_rotation_matrix_2xy(params[2])
+        adjusted_points = points_a.dot(rot.T)
+        adjusted_points += params[:2]
+        distances = self.__get_distances(adjusted_points, points_b)
+        mean_error = np.mean(distances[self.__get_trimmed_indices(distances)])
+
+        # make result
+        rot3 = create_rotation_matrix_yx(np.degrees(params[2]))
+        pos = params[:2][::-1]
 
-                # Hessian approximation
-                h = j.T @ j
+        return rot3, pos, mean_error
 
-                # Right hand side
-                e = pm - pb
-                b = j.T @ e
+    def find_closed_form_transform(self, points_a, points_b):
+        """
+        Finds the least squares rigid transform for known correspondences without iterations,
+        it's the 2D case of the Umeyama method where the rotation angle is given by atan2
+        """
+        # swap x - y
+        points_a = points_a[:, ::-1].astype(float)
+        points_b = points_b[:, ::-1].astype(float)
 
-                # accumulate
-                h_sum += h
-                b_sum += b
+        center_a = np.mean(points_a, axis=0)
+        center_b = np.mean(points_b, axis=0)
+        centered_a = points_a - center_a
+        centered_b = points_b - center_b
 
-            params_update = -np.linalg.pinv(h_sum) @ b_sum
-            params += params_update
+        # rotation maximizing the correlation between centered point sets
+        sin_sum = np.sum(centered_a[:, 0] * centered_b[:, 1] - centered_a[:, 1] * centered_b[:, 0])
+        cos_sum = np.sum(centered_a[:, 0] * centered_b[:, 0] + centered_a[:, 1] * centered_b[:, 1])
+        angle = math.atan2(sin_sum, cos_sum)
+        rot = create_rotation_matrix_2xy(angle)
+        translation = center_b - rot @ center_a
 
         # Calculate an error
-        rot = create_rotation_matrix_2xy(params[2])
         adjusted_points = points_a.dot(rot.T)
-        adjusted_points += params[:2]
+        adjusted_points += translation
         distances = self.__get_distances(adjusted_points, points_b)
         mean_error = np.mean(distances)
 
         # make result
-        rot3 = create_rotation_matrix_yx(np.degrees(params[2]))
-        pos = params[:2][::-1]
+        rot3 = create_rotation_matrix_yx(np.degrees(angle))
+        pos = translation[::-1]
 
         return rot3, pos, mean_error
 
+    def find_nearest_transform(self, points_a, kd_tree_b, normals_b=None, max_distance=20, initial_guess=None):
+        """
+        ICP without known correspondences, the points_a are associated with the nearest target points
+        every iteration. The kd_tree_b is a spatial index over the target points.
+        If target normals are given the point-to-line error is minimized, otherwise the point-to-point one.
+        The optional initial_guess is a (rotation, position) pair in the same form as the result.
+        """
+        points_b = kd_tree_b.data
+        tr = np.identity(3)
+        if initial_guess is not None:
+            tr[:2, :2] = initial_guess[0][:2, :2]
+            tr[:2, 2] = initial_guess[1][:2]
+        mean_error = np.inf
+        for i in range(self.__max_iterations):
+            adjusted_points = transform_points(points_a, tr, target_type=float)
+            distances, indices = kd_tree_b.query(adjusted_points, distance_upper_bound=max_distance)
+            inliers = np.isfinite(distances)
+            if np.count_nonzero(inliers) < 3:
+                break
+
+            if normals_b is None:
+                rot, pos, mean_error = self.find_closed_form_transform(adjusted_points[inliers],
+                                                                       points_b[indices[inliers]])
+            else:
+                rot, pos, mean_error = self.__find_point_to_line_update(adjusted_points[inliers],
+                                                                        points_b[indices[inliers]],
+                                                                        normals_b[indices[inliers]])
+            # accumulate the transform update
+            tr_update = rot.copy()
+            tr_update[:2, 2] = pos
+            tr = tr_update @ tr
+
+            # test if we can stop
+            angle_update = np.arctan2(rot[1, 0], rot[0, 0])
+            if np.linalg.norm(pos) < self.__tolerance and abs(angle_update) < self.__tolerance:
+                break
+
+        rot = np.identity(3)
+        rot[:2, :2] = tr[:2, :2]
+        pos = tr[:2, 2]
+        return rot, pos, mean_error
+
+    @staticmethod
+    def __find_point_to_line_update(points_a, points_b, normals_b):
+        # Gauss-Newton step for the (ty, tx, angle) update, the rotation derivative at zero angle is (x, -y)
+        e = np.sum(normals_b * (points_a - points_b), axis=1)
+        j = np.stack([normals_b[:, 0], normals_b[:, 1],
+                      normals_b[:, 0] * points_a[:, 1] - normals_b[:, 1] * points_a[:, 0]], axis=1)
+        params_update = -np.linalg.pinv(j.T @ j) @ (j.T @ e)
+
+        rot = create_rotation_matrix_yx(np.degrees(params_update[2]))
+        pos = params_update[:2]
+        mean_error = np.mean(np.abs(e))
+        return rot, pos, mean_error
+
     def __get_distances(self, points_a, points_b):
         assert points_a.shape == points_b.shape
         distances = np.linalg.norm(points_a - points_b, axis=1)
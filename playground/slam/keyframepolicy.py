@@ -0,0 +1,27 @@
+import math
+
+
+class KeyFramePolicy:
+    """
+    Decides if an aligned frame becomes a new key frame, it happens when the frame moved or rotated enough
+    from the last key frame or when their scans overlap too little
+    """
+
+    def __init__(self, min_translation=20, min_rotation=20, min_overlap=0.7, overlap_distance=5):
+        self.__min_translation = min_translation  # distance in pixels
+        self.__min_rotation = min_rotation  # angle in degrees
+        self.__min_overlap = min_overlap  # ratio of frame points which are near to the key frame points
+        self.__overlap_distance = overlap_distance  # distance in pixels
+
+    @property
+    def overlap_distance(self):
+        return self.__overlap_distance
+
+    def is_key_frame(self, relative_position, relative_rotation, overlap):
+        """
+        Takes the frame pose relative to the last key frame and the scans overlap ratio
+        """
+        translation = math.hypot(relative_position[0], relative_position[1])
+        rotation = abs(math.degrees(math.atan2(relative_rotation[1, 0], relative_rotation[0, 0])))
+        return translation >= self.__min_translation or rotation >= self.__min_rotation or \
+            overlap < self.__min_overlap
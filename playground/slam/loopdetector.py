@@ -0,0 +1,117 @@
+from collections import deque
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def compute_ring_descriptor(points, num_rings, max_range):
+    """
+    Scan-Context like ring key: the ratio of scan points in every range ring around the sensor,
+    it doesn't depend on the sensor rotation
+    """
+    ranges = np.hypot(points[:, 0], points[:, 1])
+    histogram, _ = np.histogram(ranges, bins=num_rings, range=(0, max_range))
+    return histogram / max(points.shape[0], 1)
+
+
+class DescriptorIndex:
+    """
+    Nearest neighbours index which grows incrementally. New descriptors are searched linearly in a small buffer,
+    the full buffer is merged with KD-trees of the same size into a twice larger tree, so a query checks
+    a logarithmic number of trees and every descriptor is indexed again a logarithmic number of times.
+    """
+
+    def __init__(self, buffer_size=16):
+        self.__buffer_size = buffer_size
+        self.__buffer = []  # descriptors which aren't indexed yet
+        self.__buffer_ids = []
+        self.__trees = []  # (tree, ids) pairs sorted by the decreasing size
+
+    def __len__(self):
+        return len(self.__buffer) + sum(ids.shape[0] for _, ids in self.__trees)
+
+    def add(self, item_id, descriptor):
+        self.__buffer.append(np.asarray(descriptor, dtype=float))
+        self.__buffer_ids.append(item_id)
+        if len(self.__buffer) < self.__buffer_size:
+            return
+        descriptors = np.array(self.__buffer)
+        ids = np.array(self.__buffer_ids)
+        self.__buffer = []
+        self.__buffer_ids = []
+        while len(self.__trees) > 0 and self.__trees[-1][1].shape[0] == ids.shape[0]:
+            tree, tree_ids = self.__trees.pop()
+            descriptors = np.concatenate([tree.data, descriptors])
+            ids = np.concatenate([tree_ids, ids])
+        self.__trees.append((cKDTree(descriptors), ids))
+
+    def query(self, descriptor, k=1, max_distance=np.inf):
+        """
+        Returns up to k (distance, id) pairs of descriptors closer than max_distance sorted by the distance
+        """
+        descriptor = np.asarray(descriptor, dtype=float)
+        distances = []
+        ids = []
+        if len(self.__buffer) > 0:
+            distances.append(np.linalg.norm(np.array(self.__buffer) - descriptor, axis=1))
+            ids.append(np.array(self.__buffer_ids))
+        for tree, tree_ids in self.__trees:
+            tree_distances, indices = tree.query(descriptor, k=k, distance_upper_bound=max_distance)
+            tree_distances = np.atleast_1d(tree_distances)
+            indices = np.atleast_1d(indices)
+            found = np.isfinite(tree_distances)
+            distances.append(tree_distances[found])
+            ids.append(tree_ids[indices[found]])
+        if len(distances) == 0:
+            return []
+        distances = np.concatenate(distances)
+        ids = np.concatenate(ids)
+        order = np.argsort(distances, kind='stable')
+        order = order[distances[order] < max_distance][:k]
+        return [(float(distances[i]), ids[i].item()) for i in order]
+
+
+class LoopDetector:
+    """
+    Finds loop closure candidates among old key frames with similar scan descriptors,
+    candidates have to be verified with the scans alignment
+    """
+
+    def __init__(self, num_rings=24, max_range=350, min_frame_gap=30, num_candidates=3, max_distance=0.1,
+                 min_loop_interval=10):
+        self.__num_rings = num_rings
+        self.__max_range = max_range  # the sensor range in pixels
+        self.__min_frame_gap = min_frame_gap  # number of the latest frames which can't be candidates
+        self.__num_candidates = num_candidates
+        self.__max_distance = max_distance  # the Euclidean distance between similar descriptors is smaller
+        self.__min_loop_interval = min_loop_interval  # number of frames without candidates after a loop closure
+        self.__index = DescriptorIndex()
+        # descriptors of the latest frames are added to the index when they become old enough
+        self.__recent_descriptors = deque()
+        self.__num_frames = 0
+        self.__last_loop_index = None
+
+    @property
+    def num_frames(self):
+        return self.__num_frames
+
+    def add_frame(self, points):
+        """
+        Adds the key frame scan with the next index, returns indices of candidate frames sorted by the similarity
+        """
+        descriptor = compute_ring_descriptor(points, self.__num_rings, self.__max_range)
+        frame_index = self.__num_frames
+        candidates = []
+        if self.__last_loop_index is None or frame_index - self.__last_loop_index >= self.__min_loop_interval:
+            candidates = self.__index.query(descriptor, k=self.__num_candidates, max_distance=self.__max_distance)
+        self.__recent_descriptors.append(descriptor)
+        if len(self.__recent_descriptors) > self.__min_frame_gap:
+            self.__index.add(frame_index - self.__min_frame_gap, self.__recent_descriptors.popleft())
+        self.__num_frames += 1
+        return [candidate_index for _, candidate_index in candidates]
+
+    def confirm_loop_closure(self, frame_index):
+        """
+        Marks the frame as verified loop closure, the next few frames don't get candidates
+        """
+        self.__last_loop_index = frame_index
@@ -0,0 +1,105 @@
+import numpy as np
+import pygame
+
+from playground.utils.tiledmap import TiledMap
+from playground.utils.transform import transform_points
+
+
+class OccupancyGrid:
+    """
+    Probabilistic occupancy map, every cell keeps the log-odds of being occupied.
+    The map is split into square tiles which are allocated only when a measurement touches them,
+    cells outside the world image are kept too.
+    """
+
+    def __init__(self, world_h, world_w, tile_size=64, hit_log_odds=0.9, miss_log_odds=-0.4, max_log_odds=5.):
+        self.__h = world_h
+        self.__w = world_w
+        # log-odds are stored as int8 values with a fixed resolution
+        self.__resolution = 0.05
+        self.__hit = int(round(hit_log_odds / self.__resolution))
+        self.__miss = int(round(miss_log_odds / self.__resolution))
+        self.__max_value = min(int(round(max_log_odds / self.__resolution)), 127)
+        self.__log_odds = TiledMap(tile_size=tile_size, dtype=np.int8)
+        # gray levels for every stored value, occupied cells are black and free cells are white
+        values = np.arange(-128, 128) * self.__resolution
+        self.__palette = np.round(255 / (1 + np.exp(values))).astype(np.uint8)
+        self.__image = np.full((world_h, world_w), self.__palette[128], dtype=np.uint8)
+
+    @property
+    def num_tiles(self):
+        return self.__log_odds.num_tiles
+
+    @property
+    def image(self):
+        return self.__image
+
+    def clear(self):
+        self.__log_odds.clear()
+        self.__image[:, :] = self.__palette[128]
+
+    def __to_map_coords(self, positions):
+        positions = np.asarray(positions).astype(int).reshape((-1, 2))
+        return np.stack([self.__h // 2 - positions[:, 0], self.__w // 2 + positions[:, 1]], axis=1)
+
+    def __update_cells(self, cells, value):
+        """
+        Adds the value to the log-odds of unique map cells and redraws them
+        """
+        log_odds = self.__log_odds.add(cells, value, -self.__max_value, self.__max_value)
+        inside = np.all((cells >= 0) & (cells < [self.__h, self.__w]), axis=1)
+        self.__image[cells[inside, 0], cells[inside, 1]] = self.__palette[log_odds[inside].astype(int) + 128]
+
+    def __get_ray_cells(self, start, ends):
+        """
+        Returns cells crossed by rays from the start to every end, the end cells are excluded
+        """
+        deltas = ends - start
+        lengths = np.max(np.abs(deltas), axis=1)
+        ray_indices = np.repeat(np.arange(ends.shape[0]), lengths)
+        steps = np.arange(ray_indices.shape[0]) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        fractions = steps / lengths[ray_indices]
+        return start + np.rint(fractions[:, None] * deltas[ray_indices]).astype(int)
+
+    def insert_scan(self, position, points):
+        """
+        Updates the map with obstacles points observed from the position, both are in the world coordinate system.
+        Cells between the position and the obstacles become more free and the obstacles cells more occupied.
+        """
+        start = self.__to_map_coords(position)[0]
+        ends = self.__to_map_coords(points)
+        free_cells = self.__get_ray_cells(start, ends)
+
+        # cells are encoded relative to the scan bounding box to find unique ones
+        scan_cells = np.vstack([start, ends])
+        min_cell = scan_cells.min(axis=0)
+        num_cols = scan_cells[:, 1].max() - min_cell[1] + 1
+        hit_keys = np.unique((ends[:, 0] - min_cell[0]) * num_cols + ends[:, 1] - min_cell[1])
+        free_keys = (free_cells[:, 0] - min_cell[0]) * num_cols + free_cells[:, 1] - min_cell[1]
+        # every cell is updated only once per scan, and cells with hits aren't cleared
+        free_keys = np.setdiff1d(free_keys, hit_keys)
+
+        self.__update_cells(np.stack([free_keys // num_cols, free_keys % num_cols], axis=1) + min_cell, self.__miss)
+        self.__update_cells(np.stack([hit_keys // num_cols, hit_keys % num_cols], axis=1) + min_cell, self.__hit)
+
+    def insert_frame(self, frame):
+        """
+        Updates the map with the frame points placed with the frame pose
+        """
+        points = transform_points(frame.observed_points[:, :2], frame.rotation, target_type=float)
+        points += frame.position[:2]
+        self.insert_scan(frame.position[:2], points)
+
+    def get_log_odds(self, positions):
+        """
+        Returns log-odds of cells at world positions, unknown cells have zero log-odds
+        """
+        return self.__log_odds.get(self.__to_map_coords(positions)) * self.__resolution
+
+    def get_probabilities(self, positions):
+        return 1 / (1 + np.exp(-self.get_log_odds(positions)))
+
+    def draw(self, screen, offset):
+        transposed_map = np.transpose(self.__image)
+        surf = pygame.surfarray.make_surface(transposed_map)
+        screen.blit(surf, (offset, 0))
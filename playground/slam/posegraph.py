@@ -2,17 +2,25 @@ import numpy as np
 import scipy.sparse
 import scipy.sparse.linalg
 
-from playground.utils.transform import v2t, t2v
+from playground.utils.transform import v2t, wrap_to_pi, create_rotation_matrices_2xy
 
 
 class PoseGraph:
-    def __init__(self, edge_sigma_x, edge_sigma_y, edge_sigma_angle):
+    def __init__(self, edge_sigma_x, edge_sigma_y, edge_sigma_angle, odometry_sigma_x=3., odometry_sigma_y=3.,
+                 odometry_sigma_angle=0.3, relinearize_threshold=0.):
         self.__prior_pose_index = -1
         self.__factors = []
         self.__values = dict()
+        # the normal equation matrix is rebuilt only when vertices move farther than the threshold,
+        # otherwise its factorization is reused
+        self.__relinearize_threshold = relinearize_threshold
+        self.__clear_linearization()
         # an information matrix is the inverse of a covariance matrix
         self.__edge_noise_model = np.diag([edge_sigma_y, edge_sigma_x, edge_sigma_angle])
         self.__edge_noise_model = np.linalg.inv(self.__edge_noise_model)
+        # odometry edges have own noise model, odometry errors don't depend on scans
+        self.__odometry_noise_model = np.diag([odometry_sigma_y, odometry_sigma_x, odometry_sigma_angle])
+        self.__odometry_noise_model = np.linalg.inv(self.__odometry_noise_model)
 
     @property
     def prior_pose_index(self):
@@ -36,109 +44,206 @@ class PoseGraph:
             factor = vertex_index_a, vertex_index_b, np.array([tx, ty, rot]), noise_model
             self.__factors.append(factor)
 
+    def add_odometry_edge(self, vertex_index_a, vertex_index_b, tx, ty, rot):
+        self.add_factor_edge(vertex_index_a, vertex_index_b, tx, ty, rot, noise_model=self.__odometry_noise_model)
+
     def clear(self):
         self.__factors.clear()
         self.__values.clear()
-
-    def __compute_error(self, value_index_i, value_index_j, factor_transform):
-        # value & factor_transform : ty, tx, rot
-        # Create transformation matrices from vectors
-        t_i = v2t(self.__values[value_index_i])
-        t_j = v2t(self.__values[value_index_j])
-        t_z = v2t(factor_transform)
-
-        # Calculate error vector
-        error = t2v(np.linalg.inv(t_z) @ (np.linalg.inv(t_i) @ t_j))
-        return error
-
-    def __compute_jacobian(self, value_index_i, value_index_j, factor_transform):
-        v_i = self.__values[value_index_i]
-        v_j = self.__values[value_index_j]
-        si = np.sin(v_i[2])
-        ci = np.cos(v_i[2])
-        dr_i = np.array([[-si, ci], [-ci, -si]]).T
-        dt_ij = np.array([v_j[:2] - v_i[:2]]).T
-
-        t_i = v2t(v_i)
-        t_z = v2t(factor_transform)
-        r_i = t_i[:2, :2]
-        r_z = t_z[:2, :2]
-
-        a_ij = np.vstack((np.hstack((-r_z.T @ r_i.T, (r_z.T @ dr_i.T) @ dt_ij)),
-                          [0, 0, -1]))
-
-        b_ij = np.vstack((np.hstack((r_z.T @ r_i.T, np.zeros((2, 1)))),
-                          [0, 0, 1]))
+        self.__clear_linearization()
+
+    def __clear_linearization(self):
+        num_params = 3
+        # factors converted to arrays, they are extended with new factors only
+        self.__factor_ids = np.empty((0, 2), dtype=int)
+        self.__factor_transforms = np.empty((0, num_params))
+        self.__factor_noise_models = np.empty((0, num_params, num_params))
+        self.__linearization_values = None  # vertex values the normal equation matrix was built for
+        self.__structure = None  # sparse structure of the normal equations
+        self.__factorization = None  # LU factorization of the normal equation matrix
+
+    def __compute_errors(self, values, factors_i, factors_j, factors_transforms):
+        # values & factors_transforms : ty, tx, rot
+        # it's a vectorized version of t2v(inv(t_z) @ (inv(t_i) @ t_j)) for all factors
+        v_i = values[factors_i]
+        v_j = values[factors_j]
+        r_i_t = create_rotation_matrices_2xy(v_i[:, 2]).transpose((0, 2, 1))
+        r_z_t = create_rotation_matrices_2xy(factors_transforms[:, 2]).transpose((0, 2, 1))
+        dt_ij = v_j[:, :2] - v_i[:, :2]
+
+        errors = np.zeros(factors_transforms.shape)
+        errors[:, :2] = np.einsum('nij,nj->ni', r_z_t,
+                                  np.einsum('nij,nj->ni', r_i_t, dt_ij) - factors_transforms[:, :2])
+        errors[:, 2] = wrap_to_pi(v_j[:, 2] - v_i[:, 2] - factors_transforms[:, 2])
+        return errors
+
+    def __compute_jacobians(self, values, factors_i, factors_j, factors_transforms):
+        num_factors = factors_transforms.shape[0]
+        v_i = values[factors_i]
+        v_j = values[factors_j]
+        si = np.sin(v_i[:, 2])
+        ci = np.cos(v_i[:, 2])
+        # derivative of the transposed rotation matrix of i
+        dr_i_t = np.stack([np.stack([-si, ci], axis=1), np.stack([-ci, -si], axis=1)], axis=1)
+        dt_ij = v_j[:, :2] - v_i[:, :2]
+
+        r_i_t = create_rotation_matrices_2xy(v_i[:, 2]).transpose((0, 2, 1))
+        r_z_t = create_rotation_matrices_2xy(factors_transforms[:, 2]).transpose((0, 2, 1))
+        r_zi = r_z_t @ r_i_t
+
+        a_ij = np.zeros((num_factors, 3, 3))
+        a_ij[:, :2, :2] = -r_zi
+        a_ij[:, :2, 2] = np.einsum('nij,nj->ni', r_z_t @ dr_i_t, dt_ij)
+        a_ij[:, 2, 2] = -1
+
+        b_ij = np.zeros((num_factors, 3, 3))
+        b_ij[:, :2, :2] = r_zi
+        b_ij[:, 2, 2] = 1
         return a_ij, b_ij
 
-    def optimize(self, tolerance=1e-5, iterations=100):
-        num_params = 3  # tx, ty, rot
-        for _ in range(iterations):
-            # Building the Linear system
-
-            num_values = len(self.__values)
-            # define the normal equation matrix
-            h = scipy.sparse.csc_matrix((num_values * num_params, num_values * num_params))
-
-            # define the coefficient vector
-            b = scipy.sparse.csc_matrix((num_values * num_params, 1))
-
-            for factor in self.__factors:
-                value_index_i, value_index_j, factor_transform, factor_noise_model = factor
-
-                # compute the error
-                e = self.__compute_error(value_index_i, value_index_j, factor_transform)
-
-                # compute Jacobian parts
-                a_ij, b_ij = self.__compute_jacobian(value_index_i, value_index_j, factor_transform)
-
-                # prepare H and b blocks
-                h_ii = a_ij.T @ factor_noise_model @ a_ij
-                h_ij = a_ij.T @ factor_noise_model @ b_ij
-                h_jj = b_ij.T @ factor_noise_model @ b_ij
-                b_i = -a_ij.T @ factor_noise_model @ e
-                b_j = -b_ij.T @ factor_noise_model @ e
+    def __update_factor_arrays(self):
+        num_factors = self.__factor_ids.shape[0]
+        new_factors = self.__factors[num_factors:]
+        if len(new_factors) == 0:
+            return
+        num_params = 3
+        self.__factor_ids = np.concatenate([self.__factor_ids, [factor[:2] for factor in new_factors]])
+        self.__factor_transforms = np.concatenate([self.__factor_transforms, [factor[2] for factor in new_factors]])
+        self.__factor_noise_models = np.concatenate([self.__factor_noise_models,
+                                                     [factor[3] for factor in new_factors]])
+        self.__structure = None
+
+    def __get_structure(self, num_values, factors_i, factors_j):
+        """
+        Sparse structure of the normal equations, it's built once for the current vertices and factors
+        """
+        if self.__structure is not None and self.__structure[0] == num_values:
+            return self.__structure
+        num_params = 3
+        size = num_values * num_params
+        # Every factor contributes to the ii, ij, ji and jj blocks.
+        block = np.arange(num_params)
+        block_rows = np.repeat(block, num_params)
+        block_cols = np.tile(block, num_params)
+        rows = []
+        cols = []
+        for block_i, block_j in [(factors_i, factors_i), (factors_i, factors_j),
+                                 (factors_j, factors_i), (factors_j, factors_j)]:
+            rows.append((num_params * block_i[:, None] + block_rows).ravel())
+            cols.append((num_params * block_j[:, None] + block_cols).ravel())
+        # The system (H b) is built only from relative constraints so H is not full rank.
+        # So we fix the position of the 1st vertex
+        rows.append(block)
+        cols.append(block)
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        # duplicated entries are summed into the CSC data array, its entries are sorted by columns and rows
+        entries, data_indices = np.unique(cols * size + rows, return_inverse=True)
+        indices = entries % size
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(entries // size, minlength=size))])
+        b_indices_i = (num_params * factors_i[:, None] + block).ravel()
+        b_indices_j = (num_params * factors_j[:, None] + block).ravel()
+        self.__structure = num_values, data_indices, indices, indptr, b_indices_i, b_indices_j
+        self.__factorization = None
+        return self.__structure
+
+    def __linearize(self, values, errors, factors_i, factors_j):
+        """
+        Returns the normal equation matrix H and the coefficient vector b, H is None if the factorization of
+        the last matrix can be reused, when no vertex moved farther than the relinearize threshold since then
+        """
+        num_params = values.shape[1]
+        size = values.shape[0] * num_params
+        _, data_indices, indices, indptr, b_indices_i, b_indices_j = self.__get_structure(values.shape[0],
+                                                                                          factors_i, factors_j)
+
+        # compute Jacobian parts
+        a_ij, b_ij = self.__compute_jacobians(values, factors_i, factors_j, self.__factor_transforms)
+        a_ij_t_omega = a_ij.transpose((0, 2, 1)) @ self.__factor_noise_models
+        b_ij_t_omega = b_ij.transpose((0, 2, 1)) @ self.__factor_noise_models
+
+        # the coefficient vector is always computed for the current values, so the optimum doesn't change
+        b_i = -np.einsum('nij,nj->ni', a_ij_t_omega, errors)
+        b_j = -np.einsum('nij,nj->ni', b_ij_t_omega, errors)
+        b = np.bincount(b_indices_i, weights=b_i.ravel(), minlength=size)
+        b += np.bincount(b_indices_j, weights=b_j.ravel(), minlength=size)
+
+        if self.__factorization is not None and \
+                (np.abs(values - self.__linearization_values) <= self.__relinearize_threshold).all():
+            return None, b
+
+        # prepare H blocks
+        h_ii = a_ij_t_omega @ a_ij
+        h_ij = a_ij_t_omega @ b_ij
+        h_jj = b_ij_t_omega @ b_ij
+        data = np.concatenate([h_ii.ravel(), h_ij.ravel(), h_ij.transpose((0, 2, 1)).ravel(), h_jj.ravel(),
+                               np.ones(num_params)])
+        data = np.bincount(data_indices, weights=data, minlength=indices.shape[0])
+        h = scipy.sparse.csc_matrix((data, indices, indptr), shape=(size, size))
+        self.__linearization_values = values.copy()
+        return h, b
+
+    def __get_value_arrays(self):
+        # vertices are stored in a dense array in the order of their ids
+        value_ids = np.array(sorted(self.__values.keys()))
+        values = np.array([self.__values[value_id] for value_id in value_ids])
+        self.__update_factor_arrays()
+        factors_i = np.searchsorted(value_ids, self.__factor_ids[:, 0])
+        factors_j = np.searchsorted(value_ids, self.__factor_ids[:, 1])
+        return value_ids, values, factors_i, factors_j
+
+    def get_linear_system(self):
+        """
+        Returns the normal equation matrix H and the coefficient vector b for the current values,
+        vertices are ordered by their ids and the 1st vertex is fixed
+        """
+        _, values, factors_i, factors_j = self.__get_value_arrays()
+        errors = self.__compute_errors(values, factors_i, factors_j, self.__factor_transforms)
+        self.__factorization = None
+        h, b = self.__linearize(values, errors, factors_i, factors_j)
+        return h, b
 
-                def id2index(value_id):
-                    return slice((num_params * value_id), (num_params * (value_id + 1)))
+    def optimize(self, tolerance=1e-5, iterations=100, progress_callback=None):
+        """
+        Optimizes the graph, the optional progress_callback(iteration, error) is called after every iteration
+        """
+        num_params = 3  # tx, ty, rot
+        if len(self.__factors) == 0:
+            return
 
-                # update the coefficient vector
-                b[id2index(value_index_i)] += b_i
-                b[id2index(value_index_j)] += b_j
+        value_ids, values, factors_i, factors_j = self.__get_value_arrays()
+        num_values = len(value_ids)
 
-                # update the normal equation matrices
-                h[id2index(value_index_i), id2index(value_index_i)] += h_ii
-                h[id2index(value_index_i), id2index(value_index_j)] += h_ij
-                h[id2index(value_index_j), id2index(value_index_i)] += h_ij.T
-                h[id2index(value_index_j), id2index(value_index_j)] += h_jj
+        errors = self.__compute_errors(values, factors_i, factors_j, self.__factor_transforms)
+        for iteration in range(iterations):
+            # Building the Linear system
+            h, b = self.__linearize(values, errors, factors_i, factors_j)
 
             # Solving the linear system
-
-            # The system (H b) is built only from relative constraints so H is not full rank.
-            # So we fix the position of the 1st vertex
-            h[:num_params, :num_params] += np.eye(3)
-
-            values_update = scipy.sparse.linalg.spsolve(h, b)
+            if h is not None:
+                try:
+                    self.__factorization = scipy.sparse.linalg.splu(h)
+                except RuntimeError:
+                    # the system is singular, so values can't be updated anymore
+                    self.__factorization = None
+                    break
+            values_update = self.__factorization.solve(b)
             values_update[np.isnan(values_update)] = 0
-            values_update = np.reshape(values_update, (len(self.__values), num_params))
-
-            self.__update_values(values_update)
+            values += np.reshape(values_update, (num_values, num_params))
 
             # compute a mean error
-            mean_error = 0
-            for factor in self.__factors:
-                value_index_i, value_index_j, factor_transform, _ = factor
-                mean_error += self.__compute_error(value_index_i, value_index_j, factor_transform)
-            mean_error /= len(self.__factors)
-
-            # check if we converged
-            if (mean_error <= tolerance).all():
+            errors = self.__compute_errors(values, factors_i, factors_j, self.__factor_transforms)
+            mean_error = np.mean(errors, axis=0)
+            if progress_callback is not None:
+                progress_callback(iteration + 1,
+                                  np.einsum('ni,nij,nj->', errors, self.__factor_noise_models, errors))
+
+            # check if we converged, a warm started optimization converges when the update vanishes
+            if (mean_error <= tolerance).all() or (np.abs(values_update) <= tolerance).all():
                 break
 
-    def __update_values(self, values_update):
-        for value_id, update in enumerate(values_update):
-            self.__values[value_id] += update
-        pass
+        for value_id, value in zip(value_ids, values):
+            self.__values[value_id] = value
 
     def get_pose_at(self, index):
         v = self.__values[index]
@@ -0,0 +1,168 @@
+import math
+import threading
+import weakref
+
+import numpy as np
+from scipy import ndimage
+
+from playground.utils.transform import create_rotation_matrix_yx
+
+
+def _splat_max(shape, cells, kernel, kernel_origin):
+    """
+    Grid of the max of kernels placed at every cell, the kernel_origin is the kernel element placed at the cell
+    """
+    grid = np.zeros(shape, dtype=np.float32)
+    kernel_rows, kernel_cols = np.indices(kernel.shape)
+    offsets = (kernel_rows - kernel_origin[0]) * shape[1] + (kernel_cols - kernel_origin[1])
+    indices = cells[:, None] + offsets.ravel()[None, :]
+    np.maximum.at(grid.ravel(), indices.ravel(), np.broadcast_to(kernel.ravel(), indices.shape).ravel())
+    return grid
+
+
+class ScanGrids:
+    """
+    Likelihood grids of the reference scan: the high resolution grid keeps the score of every pixel and
+    the low resolution one keeps the max score over a block of pixels, so it bounds the high resolution score
+    of any translation inside the block. Both grids are the max of small kernels placed at scan points,
+    scores farther than 4 sigmas from the scan are zero.
+    """
+
+    def __init__(self, points, margin, block_size, sigma):
+        radius = math.ceil(4 * sigma)
+        self.origin = np.floor(np.min(points, axis=0)).astype(int) - margin
+        shape = tuple(np.ceil(np.max(points, axis=0)).astype(int) + margin + 1 - self.origin)
+        cells = np.rint(points - self.origin).astype(int)
+        cells = np.unique(cells[:, 0] * shape[1] + cells[:, 1])
+        offsets = np.arange(-radius, radius + 1)
+        kernel = np.exp(-(offsets[:, None] ** 2 + offsets[None, :] ** 2) / (2 * sigma ** 2)).astype(np.float32)
+        self.high = _splat_max(shape, cells, kernel, (radius, radius))
+        # the max over the [i, i + block_size) window in both directions, it starts block_size - 1 cells earlier
+        low_kernel = np.pad(kernel, ((block_size - 1, 0), (block_size - 1, 0)))
+        low_kernel = ndimage.maximum_filter(low_kernel, size=block_size, origin=-(block_size // 2), mode='constant')
+        self.low = _splat_max(shape, cells, low_kernel, (radius + block_size - 1, radius + block_size - 1))
+
+
+class CorrelativeScanMatcher:
+    """
+    Finds the initial guess for the scans alignment with the exhaustive search over rotations and translations,
+    translations are checked with the branch and bound over the low resolution grid blocks.
+    Rotations are searched coarse to fine: the best coarse angle is refined with the angular step around it.
+    It returns the transform from the scan into the reference frame coordinate system like the ICP.
+    """
+
+    def __init__(self, linear_window=24, angular_window=15, angular_step=1, coarse_angular_step=3, block_size=8,
+                 sigma=2, batch_size=8):
+        self.__linear_window = linear_window  # max translation in pixels
+        self.__angles = np.arange(-angular_window, angular_window + angular_step / 2, angular_step)  # degrees
+        self.__rotations = np.array([create_rotation_matrix_yx(angle)[:2, :2] for angle in self.__angles])
+        # indices of coarse angles, every fine angle is within the half of the coarse step from one of them
+        self.__coarse_stride = max(int(round(coarse_angular_step / angular_step)), 1)
+        num_angles = self.__angles.shape[0]
+        first_coarse = (num_angles - 1) // 2 % self.__coarse_stride
+        self.__coarse_indices = np.arange(first_coarse, num_angles, self.__coarse_stride)
+        self.__block_size = block_size  # side of the low resolution grid cell in pixels
+        self.__sigma = sigma  # distance in pixels where the score falls to 0.6
+        self.__batch_size = batch_size  # number of blocks checked at once with the high resolution grid
+        # block corners of the translation window and translations inside of a block
+        corners = np.arange(-linear_window, linear_window + 1, block_size)
+        self.__block_corners = np.stack(np.meshgrid(corners, corners, indexing='ij'), axis=-1).reshape((-1, 2))
+        offsets = np.arange(block_size)
+        self.__block_offsets = np.stack(np.meshgrid(offsets, offsets, indexing='ij'), axis=-1).reshape((-1, 2))
+        # the last blocks are clipped to the window, their translations outside of it aren't scored
+        translations = self.__block_corners[:, None, :] + self.__block_offsets[None, :, :]
+        self.__outside_window = np.any(translations > linear_window, axis=-1)
+        # grids are built once for every reference frame and released together with it
+        self.__grids = weakref.WeakKeyDictionary()
+        self.__lock = threading.Lock()
+
+    def __get_grids(self, reference_frame):
+        with self.__lock:
+            grids = self.__grids.get(reference_frame)
+        if grids is None:
+            # points moved to the grid border stay far from the reference scan after any translation
+            margin = 2 * (self.__linear_window + self.__block_size) + math.ceil(4 * self.__sigma)
+            grids = ScanGrids(reference_frame.observed_points[:, :2].astype(float), margin, self.__block_size,
+                              self.__sigma)
+            with self.__lock:
+                self.__grids[reference_frame] = grids
+        return grids
+
+    def __rotate(self, points, angle_indices, grids):
+        """
+        Rotated scans as flat grid cell indices, (angles, points) array.
+        Points far from the reference scan are moved to the grid border where scores are zero,
+        so any translation from the window stays inside the grid.
+        """
+        height, width = grids.high.shape
+        rotated = np.rint(points @ self.__rotations[angle_indices].transpose((0, 2, 1)) - grids.origin)
+        rotated = rotated.astype(np.int32)
+        min_cell = self.__linear_window
+        max_cell = self.__linear_window + self.__block_size
+        np.clip(rotated[..., 0], min_cell, height - 1 - max_cell, out=rotated[..., 0])
+        np.clip(rotated[..., 1], min_cell, width - 1 - max_cell, out=rotated[..., 1])
+        return rotated[..., 0] * width + rotated[..., 1]
+
+    def __search(self, points, angle_indices, grids, best):
+        """
+        Branch and bound over translations of the given angles, best is the (score, angle index, translation)
+        of the best known candidate, it's returned if no better candidate is found
+        """
+        width = grids.high.shape[1]
+        rotated = self.__rotate(points, angle_indices, grids)
+        block_corners = self.__block_corners[:, 0] * width + self.__block_corners[:, 1]
+        block_offsets = self.__block_offsets[:, 0] * width + self.__block_offsets[:, 1]
+
+        # upper bounds of scores for every rotation and translations block, (angles, blocks) array
+        bounds = np.sum(grids.low.ravel()[rotated[:, None, :] + block_corners[None, :, None]], axis=-1)
+
+        best_score, best_angle_index, best_translation = best
+        order = np.argsort(bounds, axis=None)[::-1]
+        for batch_start in range(0, order.shape[0], self.__batch_size):
+            batch = order[batch_start:batch_start + self.__batch_size]
+            batch_angles, block_indices = np.unravel_index(batch, bounds.shape)
+            # blocks are sorted, so no next block can have a better score
+            if bounds[batch_angles[0], block_indices[0]] <= best_score:
+                break
+            # scores of all translations inside of blocks, (blocks, translations) array
+            translations = block_corners[block_indices, None] + block_offsets[None, :]
+            cells = rotated[batch_angles, None, :] + translations[:, :, None]
+            scores = np.sum(grids.high.ravel()[cells], axis=-1)
+            scores[self.__outside_window[block_indices]] = -np.inf
+            block_index, offset_index = np.unravel_index(np.argmax(scores), scores.shape)
+            if scores[block_index, offset_index] > best_score:
+                best_score = scores[block_index, offset_index]
+                best_angle_index = angle_indices[batch_angles[block_index]]
+                best_translation = self.__block_corners[block_indices[block_index]] + \
+                    self.__block_offsets[offset_index]
+        return best_score, best_angle_index, best_translation
+
+    def match(self, points, reference_frame, initial_guess=None):
+        """
+        Returns the rotation, the position and the mean score of points, the score is 1 when all points
+        hit the reference scan points.
+        The optional initial_guess is a (rotation, position) pair in the same form as the result,
+        the search window is centered on it.
+        """
+        guess_rot = np.eye(3)
+        guess_pos = np.zeros(2)
+        if initial_guess is not None:
+            guess_rot[:2, :2] = initial_guess[0][:2, :2]
+            guess_pos = np.asarray(initial_guess[1][:2], dtype=float)
+            points = points @ guess_rot[:2, :2].T + guess_pos
+        grids = self.__get_grids(reference_frame)
+        points = points.astype(np.float32)
+        best = (-np.inf, 0, np.zeros(2, dtype=int))
+        best = self.__search(points, self.__coarse_indices, grids, best)
+        if self.__coarse_stride > 1:
+            # fine angles around the best coarse one, the coarse candidate bounds the search
+            coarse_index = best[1]
+            fine_indices = np.arange(max(coarse_index - self.__coarse_stride + 1, 0),
+                                     min(coarse_index + self.__coarse_stride, self.__angles.shape[0]))
+            best = self.__search(points, fine_indices[fine_indices != coarse_index], grids, best)
+        best_score, best_angle_index, best_translation = best
+
+        rot = create_rotation_matrix_yx(self.__angles[best_angle_index])
+        pos = rot[:2, :2] @ guess_pos + best_translation
+        rot = rot @ guess_rot
+        return rot, pos, best_score / max(points.shape[0], 1)
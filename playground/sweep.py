@@ -0,0 +1,96 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import playground.slam.frontend
+import playground.slam.backend
+import playground.slam.gtsambackend
+from playground.environment.world import World
+from playground.headless import HeadlessSimulation, read_commands
+from playground.odometry import Odometry
+from playground.sensor import Sensor
+
+SweepJob = namedtuple('SweepJob', ['map_file_name', 'commands_file_name', 'odometry_sigma', 'sensor_sigma',
+                                   'edge_sigma', 'angle_sigma', 'backend', 'seed'])
+
+
+def absolute_trajectory_error(positions, ground_truth):
+    """
+    Root mean square of the position errors
+    """
+    errors = np.linalg.norm(positions - ground_truth, axis=1)
+    return np.sqrt(np.mean(errors ** 2))
+
+
+def relative_pose_error(positions, ground_truth):
+    """
+    Mean error of the translations between consecutive positions
+    """
+    if positions.shape[0] < 2:
+        return 0.
+    errors = np.linalg.norm(np.diff(positions, axis=0) - np.diff(ground_truth, axis=0), axis=1)
+    return np.mean(errors)
+
+
+def run_job(job):
+    """
+    Runs the SLAM pipeline for a single job, the noise is generated with the job own random generator
+    """
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(job.seed)
+    world = World(job.map_file_name)
+    odometry = Odometry(mu=0, sigma=job.odometry_sigma, rng=rng)
+    sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=job.sensor_sigma, rng=rng)
+    front_end = playground.slam.frontend.FrontEnd(world.height, world.width)
+    if job.backend == 'gtsam':
+        back_end = playground.slam.gtsambackend.GTSAMBackEnd(edge_sigma=job.edge_sigma, angle_sigma=job.angle_sigma,
+                                                             incremental=True)
+    else:
+        back_end = playground.slam.backend.BackEnd(edge_sigma=job.edge_sigma, angle_sigma=job.angle_sigma,
+                                                   incremental=True)
+
+    simulation = HeadlessSimulation(world, odometry, sensor, front_end, back_end)
+    steps_per_second = simulation.run(read_commands(job.commands_file_name))
+
+    positions = np.array([frame.position[:2] for frame in front_end.get_frames()])
+    ground_truth = np.array(simulation.ground_truth)
+    return {
+        'job': job,
+        'ate': absolute_trajectory_error(positions, ground_truth),
+        'rpe': relative_pose_error(positions, ground_truth),
+        'num_frames': positions.shape[0],
+        'steps_per_second': steps_per_second,
+        'time': time.perf_counter() - start_time,
+    }
+
+
+def run_sweep(jobs, num_workers=None):
+    """
+    Runs jobs in parallel processes and returns their statistics in the jobs order
+    """
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(run_job, jobs))
+
+
+def summarize(results):
+    """
+    Aggregates statistics of the jobs with the same parameters over all seeds
+    """
+    groups = dict()
+    for result in results:
+        key = result['job']._replace(seed=None)
+        groups.setdefault(key, []).append(result)
+
+    summary = []
+    for key, group in groups.items():
+        summary.append({
+            'job': key,
+            'num_runs': len(group),
+            'ate_mean': np.mean([result['ate'] for result in group]),
+            'ate_std': np.std([result['ate'] for result in group]),
+            'rpe_mean': np.mean([result['rpe'] for result in group]),
+            'time_mean': np.mean([result['time'] for result in group]),
+        })
+    return summary
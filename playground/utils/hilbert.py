@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def hilbert_distances(points, p):
+    """
+    Vectorized version of the HilbertCurve.distance_from_point,
+    points is a (num_points, n) array of integer coordinates between 0 and 2**p-1
+    """
+    x = np.array(points, dtype=np.int64).T
+    n = x.shape[0]
+    m = 1 << (p - 1)
+
+    # Inverse undo excess work
+    q = m
+    while q > 1:
+        mask = q - 1
+        for i in range(n):
+            bit_set = (x[i] & q) != 0
+            t = np.where(bit_set, 0, (x[0] ^ x[i]) & mask)
+            x[0] ^= np.where(bit_set, mask, t)
+            x[i] ^= t
+        q >>= 1
+
+    # Gray encode
+    for i in range(1, n):
+        x[i] ^= x[i - 1]
+    t = np.zeros(x.shape[1], dtype=np.int64)
+    q = m
+    while q > 1:
+        t ^= np.where((x[n - 1] & q) != 0, q - 1, 0)
+        q >>= 1
+    x ^= t
+
+    # Transpose to the Hilbert integer by bits interleaving
+    distances = np.zeros(x.shape[1], dtype=np.int64)
+    for bit in range(p - 1, -1, -1):
+        for i in range(n):
+            distances = (distances << 1) | ((x[i] >> bit) & 1)
+    return distances
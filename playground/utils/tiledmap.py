@@ -0,0 +1,130 @@
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TiledMap:
+    """
+    Unbounded 2D map split into square tiles which are allocated on demand.
+    Recently used tiles are kept as arrays, other ones are stored compressed.
+    Cells are addressed with integer (row, column) pairs which can be negative.
+    """
+
+    def __init__(self, tile_size=64, dtype=np.uint8, fill_value=0, max_hot_tiles=1024):
+        self.__tile_size = tile_size
+        self.__dtype = np.dtype(dtype)
+        self.__fill_value = fill_value
+        self.__max_hot_tiles = max_hot_tiles
+        self.__hot_tiles = OrderedDict()  # tile key -> tile array, in the least recently used order
+        self.__cold_tiles = dict()  # tile key -> compressed tile
+
+    @property
+    def tile_size(self):
+        return self.__tile_size
+
+    @property
+    def num_tiles(self):
+        return len(self.__hot_tiles) + len(self.__cold_tiles)
+
+    @property
+    def fill_value(self):
+        return self.__fill_value
+
+    def clear(self):
+        self.__hot_tiles.clear()
+        self.__cold_tiles.clear()
+
+    def __get_tile(self, key, allocate):
+        tile = self.__hot_tiles.get(key)
+        if tile is not None:
+            self.__hot_tiles.move_to_end(key)
+            return tile
+        compressed_tile = self.__cold_tiles.pop(key, None)
+        if compressed_tile is not None:
+            tile = np.frombuffer(zlib.decompress(compressed_tile), dtype=self.__dtype)
+            tile = tile.reshape((self.__tile_size, self.__tile_size)).copy()
+        elif allocate:
+            tile = np.full((self.__tile_size, self.__tile_size), self.__fill_value, dtype=self.__dtype)
+        else:
+            return None
+
+        self.__hot_tiles[key] = tile
+        while len(self.__hot_tiles) > self.__max_hot_tiles:
+            cold_key, cold_tile = self.__hot_tiles.popitem(last=False)
+            self.__cold_tiles[cold_key] = zlib.compress(cold_tile.tobytes())
+        return tile
+
+    def __group_by_tiles(self, cells):
+        """
+        Splits cells by tiles, yields tile keys, indices of cells in the group and cells coordinates in the tile
+        """
+        cells = np.asarray(cells, dtype=int).reshape((-1, 2))
+        if cells.shape[0] == 0:
+            return
+        tiles = cells // self.__tile_size
+        tile_rows = tiles[:, 0] - tiles[:, 0].min()
+        tile_cols = tiles[:, 1] - tiles[:, 1].min()
+        tile_keys = tile_rows * (tile_cols.max() + 1) + tile_cols
+        order = np.argsort(tile_keys, kind='stable')
+        starts = np.flatnonzero(np.diff(tile_keys[order], prepend=-1))
+        ends = np.append(starts[1:], order.shape[0])
+        for start, end in zip(starts, ends):
+            indices = order[start:end]
+            local_cells = cells[indices] - tiles[indices] * self.__tile_size
+            yield (int(tiles[indices[0], 0]), int(tiles[indices[0], 1])), indices, local_cells[:, 0], local_cells[:, 1]
+
+    def get(self, cells):
+        """
+        Returns values of cells, cells from not allocated tiles have the fill value
+        """
+        cells = np.asarray(cells, dtype=int).reshape((-1, 2))
+        values = np.full(cells.shape[0], self.__fill_value, dtype=self.__dtype)
+        for key, indices, rows, cols in self.__group_by_tiles(cells):
+            tile = self.__get_tile(key, allocate=False)
+            if tile is not None:
+                values[indices] = tile[rows, cols]
+        return values
+
+    def set(self, cells, values):
+        """
+        Sets values of cells, values can be a scalar or an array with a value for every cell
+        """
+        values = np.broadcast_to(values, (len(cells),))
+        for key, indices, rows, cols in self.__group_by_tiles(cells):
+            self.__get_tile(key, allocate=True)[rows, cols] = values[indices]
+
+    def add(self, cells, values, min_value=None, max_value=None):
+        """
+        Adds values to unique cells, results are clipped to the optional bounds and returned
+        """
+        values = np.broadcast_to(values, (len(cells),))
+        results = np.empty(len(cells), dtype=self.__dtype)
+        for key, indices, rows, cols in self.__group_by_tiles(cells):
+            tile = self.__get_tile(key, allocate=True)
+            result = tile[rows, cols].astype(np.int64) + values[indices]
+            if min_value is not None or max_value is not None:
+                result = np.clip(result, min_value, max_value)
+            tile[rows, cols] = result
+            results[indices] = tile[rows, cols]
+        return results
+
+    def get_window(self, top, left, height, width):
+        """
+        Returns a dense copy of the rectangular region
+        """
+        window = np.full((height, width), self.__fill_value, dtype=self.__dtype)
+        size = self.__tile_size
+        for tile_row in range(top // size, (top + height - 1) // size + 1):
+            for tile_col in range(left // size, (left + width - 1) // size + 1):
+                tile = self.__get_tile((tile_row, tile_col), allocate=False)
+                if tile is None:
+                    continue
+                row_start = max(tile_row * size, top)
+                row_end = min((tile_row + 1) * size, top + height)
+                col_start = max(tile_col * size, left)
+                col_end = min((tile_col + 1) * size, left + width)
+                window[row_start - top:row_end - top, col_start - left:col_end - left] = \
+                    tile[row_start - tile_row * size:row_end - tile_row * size,
+                         col_start - tile_col * size:col_end - tile_col * size]
+        return window
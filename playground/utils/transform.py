@@ -19,6 +19,14 @@ def create_rotation_matrix_2xy(angle):
     return mat
 
 
+def create_rotation_matrices_2xy(angles):
+    # vectorized version of the create_rotation_matrix_2xy, returns (n, 2, 2) array
+    cos_values = np.cos(angles)
+    sin_values = np.sin(angles)
+    return np.stack([np.stack([cos_values, -sin_values], axis=1),
+                     np.stack([sin_values, cos_values], axis=1)], axis=1)
+
+
 def to_screen_coords(h, w, pos, clip=True):
     y, x = pos
     y = h / 2 - y
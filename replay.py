@@ -0,0 +1,45 @@
+import argparse
+
+import playground.slam.frontend
+import playground.slam.backend
+import playground.slam.gtsambackend
+from playground.recording import LogReader, LogReplay
+from playground.slam.loopdetector import LoopDetector
+from playground.slam.scanmatcher import CorrelativeScanMatcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the SLAM pipeline with recorded sensor scans')
+    parser.add_argument('log', help='Recorded log filename')
+    parser.add_argument('--backend', choices=['basic', 'gtsam'], default='basic', help='Pose graph backend')
+    parser.add_argument('--detect-loops', action='store_true',
+                        help='Detect loop closures automatically in addition to recorded ones')
+    parser.add_argument('--no-point-ids', action='store_true',
+                        help='Align scans with nearest neighbours instead of simulator point ids')
+    parser.add_argument('--scan-matcher', action='store_true',
+                        help='Find the initial guess of the ICP with the correlative scan matcher, '
+                             'it is used only with --no-point-ids')
+    parser.add_argument('--odometry-edges', action='store_true',
+                        help='Add odometry motions between key frames into the pose graph')
+    args = parser.parse_args()
+
+    log_reader = LogReader(args.log)
+    loop_detector = LoopDetector() if args.detect_loops else None
+    scan_matcher = CorrelativeScanMatcher() if args.scan_matcher else None
+    slam_front_end = playground.slam.frontend.FrontEnd(log_reader.height, log_reader.width,
+                                                       use_point_ids=not args.no_point_ids,
+                                                       loop_detector=loop_detector, scan_matcher=scan_matcher)
+    if args.backend == 'gtsam':
+        slam_back_end = playground.slam.gtsambackend.GTSAMBackEnd(edge_sigma=0.5, angle_sigma=0.1, incremental=True,
+                                                                  odometry_edges=args.odometry_edges)
+    else:
+        slam_back_end = playground.slam.backend.BackEnd(edge_sigma=0.5, angle_sigma=0.1, incremental=True,
+                                                        odometry_edges=args.odometry_edges)
+
+    replay = LogReplay(slam_front_end, slam_back_end)
+    steps_per_second = replay.run(log_reader)
+    print(f'Replayed {len(slam_front_end.get_frames())} frames, {steps_per_second:.1f} steps/sec')
+
+
+if __name__ == '__main__':
+    main()
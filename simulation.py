@@ -5,7 +5,12 @@ from enum import Enum
 import playground.slam.frontend
 import playground.slam.backend
 import playground.slam.gtsambackend
+from playground.slam.asyncbackend import AsyncBackEnd
+from playground.slam.loopdetector import LoopDetector
+from playground.slam.occupancygrid import OccupancyGrid
+from playground.headless import Command, write_commands
 from playground.rawsensorsview import RawSensorsView
+from playground.recording import LogWriter
 from playground.robot import Robot
 from playground.odometry import Odometry
 from playground.sensor import Sensor
@@ -14,7 +19,8 @@ from playground.environment.world import World
 
 class SimulationMode(Enum):
     RAW_SENSORS = 1,
-    ICP_ADJUSTMENT = 2
+    ICP_ADJUSTMENT = 2,
+    OCCUPANCY_GRID = 3
 
 
 def main():
@@ -22,6 +28,8 @@ def main():
     pygame.display.set_caption('SLAM playground')
     parser = argparse.ArgumentParser()
     parser.add_argument('filename', help='Environmental map filename')
+    parser.add_argument('--record', help='Filename to save executed commands for the headless simulation')
+    parser.add_argument('--log', help='Filename to record sensor scans and poses for the replay')
     args = parser.parse_args()
 
     # Create simulation objects
@@ -31,16 +39,22 @@ def main():
     sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=1)  # noised measurements
     robot = Robot(odometry, sensor)
     sensors_view = RawSensorsView(world.height, world.width)
-    slam_front_end = playground.slam.frontend.FrontEnd(world.height, world.width)
-    gtsam_slam_back_end = playground.slam.gtsambackend.GTSAMBackEnd(edge_sigma=0.5, angle_sigma=0.1)
-    slam_back_end = playground.slam.backend.BackEnd(edge_sigma=0.5, angle_sigma=0.1)
+    slam_front_end = playground.slam.frontend.FrontEnd(world.height, world.width,
+                                                       loop_detector=LoopDetector(max_range=350))
+    occupancy_grid = OccupancyGrid(world.height, world.width)
+    # the pose graph is optimized in a background thread so the window isn't frozen
+    gtsam_slam_back_end = AsyncBackEnd(playground.slam.gtsambackend.GTSAMBackEnd(edge_sigma=0.5, angle_sigma=0.1,
+                                                                                   incremental=True))
+    slam_back_end = AsyncBackEnd(playground.slam.backend.BackEnd(edge_sigma=0.5, angle_sigma=0.1, incremental=True))
 
     # Initialize rendering
     screen = pygame.display.set_mode([world.width * 2, world.height])
     font = pygame.font.Font(pygame.font.get_default_font(), 24)
     sensors_text_surface = font.render('Sensors', True, (255, 0, 0))
     icp_text_surface = font.render('ICP', True, (255, 0, 0))
+    grid_text_surface = font.render('Occupancy grid', True, (255, 0, 0))
     text_pos = (15, 15)
+    progress_text_pos = (15, 45)
 
     # Robot movement configuration
     rotation_step = 10  # degrees
@@ -48,10 +62,15 @@ def main():
 
     # make first initialization
     robot.move(0, world)
+    log_writer = LogWriter(args.log, world.height, world.width) if args.log else None
     sensors_view.take_measurements(odometry, sensor)
-    slam_front_end.add_key_frame(sensor)
+    if log_writer is not None:
+        log_writer.write(sensor.get_obstacles(), odometry, robot)
+    if slam_front_end.add_key_frame(sensor, odometry):
+        occupancy_grid.insert_frame(slam_front_end.get_frames()[-1])
 
     # start simulation loop
+    commands = []
     simulation_mode = SimulationMode.RAW_SENSORS
     running = True
     while running:
@@ -63,27 +82,55 @@ def main():
                     simulation_mode = SimulationMode.RAW_SENSORS
                 if event.key == pygame.K_i:
                     simulation_mode = SimulationMode.ICP_ADJUSTMENT
+                if event.key == pygame.K_o:
+                    simulation_mode = SimulationMode.OCCUPANCY_GRID
                 if event.key == pygame.K_s:
                     # we assume that we detect a loop so can try to optimize pose graph
-                    loop_frame = slam_front_end.create_loop_closure(sensor)
-                    slam_back_end.update_frames(slam_front_end.get_frames(), loop_frame)
+                    if not slam_back_end.busy and not gtsam_slam_back_end.busy:
+                        if log_writer is not None:
+                            log_writer.write(sensor.get_obstacles(), odometry, robot, loop_closure=True)
+                        loop_frame = slam_front_end.create_loop_closure(sensor)
+                        slam_back_end.submit(slam_front_end.get_frames(), loop_frame)
+                        commands.append((Command.LOOP_CLOSURE, 0))
                     break
                 if event.key == pygame.K_g:
                     # we assume that we detect a loop so can try to optimize pose graph
-                    loop_frame = slam_front_end.create_loop_closure(sensor)
-                    gtsam_slam_back_end.update_frames(slam_front_end.get_frames(), loop_frame)
+                    if not slam_back_end.busy and not gtsam_slam_back_end.busy:
+                        if log_writer is not None:
+                            log_writer.write(sensor.get_obstacles(), odometry, robot, loop_closure=True)
+                        loop_frame = slam_front_end.create_loop_closure(sensor)
+                        gtsam_slam_back_end.submit(slam_front_end.get_frames(), loop_frame)
+                        commands.append((Command.LOOP_CLOSURE, 0))
                     break
                 if event.key == pygame.K_LEFT:
                     robot.rotate(rotation_step, world)
+                    commands.append((Command.ROTATE, rotation_step))
                 if event.key == pygame.K_RIGHT:
                     robot.rotate(-rotation_step, world)
+                    commands.append((Command.ROTATE, -rotation_step))
                 if event.key == pygame.K_UP:
                     robot.move(moving_step, world)
+                    commands.append((Command.MOVE, moving_step))
                 if event.key == pygame.K_DOWN:
                     robot.move(-moving_step, world)
+                    commands.append((Command.MOVE, -moving_step))
 
                 sensors_view.take_measurements(odometry, sensor)
-                slam_front_end.add_key_frame(sensor)
+                if log_writer is not None:
+                    log_writer.write(sensor.get_obstacles(), odometry, robot)
+                if slam_front_end.add_key_frame(sensor, odometry):
+                    occupancy_grid.insert_frame(slam_front_end.get_frames()[-1])
+                    # detected loops are optimized with the basic back end, they are skipped while it's busy
+                    loop_frame = slam_front_end.detect_loop_closure()
+                    if loop_frame is not None and not gtsam_slam_back_end.busy:
+                        slam_back_end.submit(slam_front_end.get_frames(), loop_frame)
+
+        for back_end in [slam_back_end, gtsam_slam_back_end]:
+            if back_end.apply_results(slam_front_end.get_frames()):
+                # frame poses were changed so the map is built again
+                occupancy_grid.clear()
+                for frame in slam_front_end.get_frames():
+                    occupancy_grid.insert_frame(frame)
 
         world.draw(screen)
         robot.draw(screen, world.height, world.width)
@@ -93,11 +140,24 @@ def main():
         if simulation_mode == SimulationMode.ICP_ADJUSTMENT:
             slam_front_end.draw(screen, offset=world.width)
             screen.blit(icp_text_surface, dest=text_pos)
+        if simulation_mode == SimulationMode.OCCUPANCY_GRID:
+            occupancy_grid.draw(screen, offset=world.width)
+            screen.blit(grid_text_surface, dest=text_pos)
+        for back_end in [slam_back_end, gtsam_slam_back_end]:
+            if back_end.busy:
+                iteration, error = back_end.progress
+                progress_text = f'Optimization iteration {iteration}, error {error:.2f}'
+                screen.blit(font.render(progress_text, True, (255, 0, 0)), dest=progress_text_pos)
 
         pygame.display.flip()
 
     pygame.quit()
 
+    if args.record:
+        write_commands(args.record, commands)
+    if log_writer is not None:
+        log_writer.close()
+
 
 if __name__ == '__main__':
     main()
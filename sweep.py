@@ -0,0 +1,37 @@
+import argparse
+import itertools
+
+from playground.sweep import SweepJob, run_sweep, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the headless SLAM pipeline for a grid of noise parameters '
+                                                 'and seeds in parallel processes')
+    parser.add_argument('filename', help='Environmental map filename')
+    parser.add_argument('commands', help='Scripted trajectory filename')
+    parser.add_argument('--backend', choices=['basic', 'gtsam'], default='basic', help='Pose graph backend')
+    parser.add_argument('--odometry-sigma', type=float, nargs='+', default=[3.], help='Odometry noise sigmas')
+    parser.add_argument('--sensor-sigma', type=float, nargs='+', default=[1.], help='Sensor noise sigmas')
+    parser.add_argument('--edge-sigma', type=float, nargs='+', default=[0.5], help='Pose graph edge sigmas')
+    parser.add_argument('--angle-sigma', type=float, nargs='+', default=[0.1], help='Pose graph angle sigmas')
+    parser.add_argument('--seeds', type=int, default=4, help='Number of random seeds for every parameters set')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    args = parser.parse_args()
+
+    jobs = [SweepJob(args.filename, args.commands, odometry_sigma, sensor_sigma, edge_sigma, angle_sigma,
+                     args.backend, seed)
+            for odometry_sigma, sensor_sigma, edge_sigma, angle_sigma, seed in
+            itertools.product(args.odometry_sigma, args.sensor_sigma, args.edge_sigma, args.angle_sigma,
+                              range(args.seeds))]
+
+    summary = summarize(run_sweep(jobs, args.workers))
+    summary.sort(key=lambda item: item['ate_mean'])
+    print('odometry_sigma sensor_sigma edge_sigma angle_sigma      ATE     RPE  time, s')
+    for item in summary:
+        job = item['job']
+        print(f'{job.odometry_sigma:14g} {job.sensor_sigma:12g} {job.edge_sigma:10g} {job.angle_sigma:11g} '
+              f'{item["ate_mean"]:5.2f}±{item["ate_std"]:.2f} {item["rpe_mean"]:7.3f} {item["time_mean"]:8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+from playground.headless import Command, HeadlessSimulation
+from playground.odometry import Odometry
+from playground.sensor import Sensor
+from playground.slam.asyncbackend import AsyncBackEnd, copy_frame, get_pose_matrix
+from playground.slam.backend import BackEnd
+from playground.slam.frontend import FrontEnd
+from tests.world_tests import create_world
+
+
+class AsyncBackEndTests(unittest.TestCase):
+
+    def test_optimization(self):
+        world = create_world(height=300, width=300)
+        rng = np.random.default_rng(2)
+        sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=1, rng=rng)
+        front_end = FrontEnd(world.height, world.width)
+        simulation = HeadlessSimulation(world, Odometry(mu=0, sigma=1, rng=rng), sensor, front_end,
+                                        BackEnd(edge_sigma=0.5, angle_sigma=0.1))
+        simulation.run([(Command.MOVE, 10), (Command.ROTATE, 10), (Command.ROTATE, -10), (Command.MOVE, -10)])
+        loop_frame = front_end.create_loop_closure(sensor)
+
+        expected_frames = [copy_frame(frame) for frame in front_end.get_frames()]
+        BackEnd(edge_sigma=0.5, angle_sigma=0.1).update_frames(expected_frames, loop_frame)
+
+        frames = front_end.get_frames()
+        async_back_end = AsyncBackEnd(BackEnd(edge_sigma=0.5, angle_sigma=0.1))
+        self.assertTrue(async_back_end.submit(frames, loop_frame))
+        self.assertFalse(async_back_end.submit(frames, loop_frame))
+        # the frame is added during the optimization
+        new_frame = copy_frame(frames[-1])
+        new_frame.position[:2] += [3, 4]
+        relative_pose = np.linalg.inv(get_pose_matrix(frames[-1])) @ get_pose_matrix(new_frame)
+        frames.append(new_frame)
+
+        self.assertTrue(async_back_end.wait(frames))
+        self.assertFalse(async_back_end.busy)
+        self.assertGreater(async_back_end.progress[0], 0)
+        for frame, expected_frame in zip(frames, expected_frames):
+            self.assertTrue(np.allclose(frame.position, expected_frame.position))
+            self.assertTrue(np.allclose(frame.rotation, expected_frame.rotation))
+        # the new frame keeps its pose relative to the last optimized frame
+        self.assertTrue(np.allclose(np.linalg.inv(get_pose_matrix(frames[-2])) @ get_pose_matrix(frames[-1]),
+                                    relative_pose))
+        self.assertFalse(async_back_end.apply_results(frames))
+
+
+if __name__ == '__main__':
+    unittest.main()
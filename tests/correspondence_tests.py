@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from playground.slam.correspondence import find_id_correspondences, sort_ids
+
+
+def find_correspondences(ids_a, ids_b, max_distance):
+    # brute force search
+    idx_a = []
+    idx_b = []
+    used_ids = set()
+    for i_a, id_a in enumerate(ids_a):
+        distances = np.abs(ids_b - id_a)
+        # prefer the smaller id and then the smaller index on ties
+        candidates = np.flatnonzero(distances == np.min(distances))
+        i_b = int(candidates[np.lexsort((candidates, ids_b[candidates]))[0]])
+        if i_b not in used_ids:
+            if distances[i_b] <= max_distance:
+                idx_a.append(i_a)
+                idx_b.append(i_b)
+        used_ids.add(i_b)
+    return idx_a, idx_b
+
+
+class CorrespondenceTests(unittest.TestCase):
+
+    def test_correspondences(self):
+        rng = np.random.default_rng(0)
+        ids_a = rng.integers(0, 1000, size=200)
+        ids_b = rng.integers(0, 1000, size=150)
+
+        sorted_ids_b, order_b = sort_ids(ids_b)
+        idx_a, idx_b = find_id_correspondences(ids_a, sorted_ids_b, order_b, max_distance=5)
+
+        expected_idx_a, expected_idx_b = find_correspondences(ids_a, ids_b, max_distance=5)
+        self.assertTrue(np.array_equal(idx_a, expected_idx_a))
+        self.assertTrue(np.array_equal(idx_b, expected_idx_b))
+
+    def test_empty(self):
+        sorted_ids_b, order_b = sort_ids(np.array([1, 2, 3]))
+        idx_a, idx_b = find_id_correspondences(np.array([], dtype=int), sorted_ids_b, order_b)
+        self.assertEqual(idx_a.size, 0)
+        self.assertEqual(idx_b.size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+import unittest
+import numpy as np
+from skimage.draw import line_aa
+from playground.headless import Command, HeadlessSimulation
+from playground.odometry import Odometry
+from playground.pipeline import ReplayOdometry, ReplaySensor
+from playground.sensor import Sensor
+from playground.slam.backend import BackEnd
+from playground.slam.frontend import FrontEnd
+from playground.slam.keyframepolicy import KeyFramePolicy
+from playground.slam.scanmatcher import CorrelativeScanMatcher
+from playground.utils.transform import create_rotation_matrix_yx, to_screen_coords, transform_points
+from tests.scanmatcher_tests import create_comb_points
+from tests.world_tests import create_world
+
+
+def generate_local_map(frames, h, w):
+    # draw all frames from scratch, pixels outside the map are skipped
+    local_map = np.full((h, w), 255, dtype=np.uint8)
+
+    def draw_pixels(rows, cols):
+        inside = (rows >= 0) & (rows < h) & (cols >= 0) & (cols < w)
+        local_map[rows[inside], cols[inside]] = 0
+
+    prev_pos = None
+    for frame in frames:
+        position = np.array(to_screen_coords(h, w, frame.position[:2], clip=False)).astype(int)
+        if prev_pos is not None:
+            rr, cc, _ = line_aa(prev_pos[1], prev_pos[0], position[1], position[0])
+            draw_pixels(rr, cc)
+        else:
+            draw_pixels(position[1:], position[:1])
+        prev_pos = position
+
+        points = transform_points(frame.observed_points[:, :2], frame.rotation, target_type=float)
+        points = (points + frame.position[:2]).astype(int)
+        points[:, 0] = h // 2 - points[:, 0]
+        points[:, 1] += w // 2
+        draw_pixels(points[:, 0], points[:, 1])
+    return local_map
+
+
+class FrontEndTests(unittest.TestCase):
+
+    def test_local_map(self):
+        world = create_world(height=300, width=300)
+        sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=1, rng=np.random.default_rng(1))
+        front_end = FrontEnd(world.height, world.width)
+        simulation = HeadlessSimulation(world, Odometry(mu=0, sigma=0), sensor, front_end,
+                                        BackEnd(edge_sigma=0.5, angle_sigma=0.1))
+        simulation.run([(Command.MOVE, 10), (Command.ROTATE, 10)])
+        frames = front_end.get_frames()
+        self.assertTrue(np.array_equal(front_end.local_map, generate_local_map(frames, world.height, world.width)))
+
+        # new frames are added to the existing map
+        simulation.run([(Command.ROTATE, 10), (Command.MOVE, -10)])
+        self.assertTrue(np.array_equal(front_end.local_map, generate_local_map(frames, world.height, world.width)))
+
+        # moved frames are redrawn
+        frames[1].position = frames[1].position + [7, -3, 0]
+        frames[2].rotation = frames[2].rotation @ frames[2].rotation
+        self.assertTrue(np.array_equal(front_end.local_map, generate_local_map(frames, world.height, world.width)))
+
+        # frames outside the map aren't clipped to the map borders
+        frames[3].position = frames[3].position + [400, 0, 0]
+        self.assertTrue(np.array_equal(front_end.local_map, generate_local_map(frames, world.height, world.width)))
+        frames[3].position = frames[3].position - [400, 0, 0]
+        self.assertTrue(np.array_equal(front_end.local_map, generate_local_map(frames, world.height, world.width)))
+
+    def test_large_world(self):
+        # the map keeps only tiles touched by frames, a dense map of this world would take 10 GB
+        front_end = FrontEnd(100000, 100000)
+        sensor = ReplaySensor()
+        points = np.concatenate([np.random.default_rng(0).uniform(-100, 100, (40, 2)), np.arange(40)[:, None]], axis=1)
+        sensor.update(points)
+        self.assertTrue(front_end.add_key_frame(sensor))
+        front_end.generate_local_map()
+
+    def test_key_frame_policy(self):
+        policy = KeyFramePolicy(min_translation=20, min_rotation=20, min_overlap=0.7)
+        self.assertFalse(policy.is_key_frame([10, 5], np.identity(3), 0.9))
+        self.assertTrue(policy.is_key_frame([20, 5], np.identity(3), 0.9))
+        self.assertTrue(policy.is_key_frame([0, 0], create_rotation_matrix_yx(-25), 0.9))
+        self.assertTrue(policy.is_key_frame([0, 0], np.identity(3), 0.5))
+
+        world = create_world(height=300, width=300)
+        sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=0)
+        front_end = FrontEnd(world.height, world.width, key_frame_policy=policy)
+        simulation = HeadlessSimulation(world, Odometry(mu=0, sigma=0), sensor, front_end,
+                                        BackEnd(edge_sigma=0.5, angle_sigma=0.1))
+        simulation.run([(Command.MOVE, 15), (Command.MOVE, 15), (Command.MOVE, -15)])
+        # the first frame and the frame after two moves are key frames, others are only tracked
+        frames = front_end.get_frames()
+        self.assertEqual(len(frames), 2)
+        self.assertTrue(np.allclose(frames[1].position[:2], [30, 0], atol=1))
+        self.assertTrue(np.allclose(front_end.current_frame.position[:2], [15, 0], atol=1))
+
+        # the tracked frame becomes a key frame on the loop closure
+        simulation.run([(Command.LOOP_CLOSURE, 0)])
+        self.assertEqual(len(front_end.get_frames()), 3)
+        self.assertEqual(len(simulation.ground_truth), 3)
+
+    def test_alignment_window(self):
+        rng = np.random.default_rng(0)
+        points = np.concatenate([rng.uniform(-100, 100, (40, 2)), np.arange(40)[:, None] * 100], axis=1)
+        other_points = points.copy()
+        other_points[:, 2] += 10000
+        front_end = FrontEnd(200, 200, last_num_to_check=2)
+        sensor = ReplaySensor()
+        # the last scan shares points only with the first one
+        rotation = create_rotation_matrix_yx(10)
+        scans = [points, np.concatenate([points[:20], other_points[20:]]), points[20:]]
+        moved_scan = transform_points(scans[2][:, :2], rotation, target_type=float) + [5, -3]
+        scans[2] = np.concatenate([moved_scan, scans[2][:, 2:]], axis=1)
+        for scan in scans:
+            sensor.update(scan)
+            self.assertTrue(front_end.add_key_frame(sensor))
+
+        # the pose comes from the alignment with the first frame, the edge to the previous one is computed from poses
+        frames = front_end.get_frames()
+        self.assertEqual(frames[1].extra_edges, [])
+        self.assertEqual(len(frames[2].extra_edges), 1)
+        reference_index, position, edge_rotation = frames[2].extra_edges[0]
+        self.assertEqual(reference_index, 0)
+        inv_rotation = np.linalg.inv(rotation)
+        self.assertTrue(np.allclose(edge_rotation, inv_rotation, atol=1e-3))
+        self.assertTrue(np.allclose(frames[2].rotation, inv_rotation, atol=1e-3))
+        self.assertTrue(np.allclose(frames[2].relative_icp_rotation, inv_rotation, atol=1e-3))
+        expected_position = transform_points(-np.array([[5, -3]]), inv_rotation, target_type=float)[0]
+        self.assertTrue(np.allclose(frames[2].position[:2], expected_position, atol=0.2))
+        self.assertTrue(np.allclose(position, expected_position, atol=0.2))
+        self.assertTrue(np.allclose(frames[2].relative_icp_position, frames[2].position[:2], atol=1e-2))
+
+    def test_pose_composition(self):
+        # the last step rotates and moves at once from a rotated key frame
+        rng = np.random.default_rng(1)
+        world_points = rng.uniform(-100, 100, (60, 2))
+        poses = [(np.zeros(2), 0), (np.array([4., -2.]), 30), (np.array([12., 5.]), 40)]
+        front_end = FrontEnd(200, 200)
+        sensor = ReplaySensor()
+        for position, angle in poses:
+            rotation = create_rotation_matrix_yx(angle)
+            scan = transform_points(world_points - position, rotation.T, target_type=float)
+            sensor.update(np.concatenate([scan, np.arange(60)[:, None]], axis=1))
+            self.assertTrue(front_end.add_key_frame(sensor))
+
+        for frame, (position, angle) in zip(front_end.get_frames(), poses):
+            self.assertTrue(np.allclose(frame.position[:2], position, rtol=0, atol=0.1))
+            self.assertTrue(np.allclose(frame.rotation, create_rotation_matrix_yx(angle), rtol=0, atol=1e-3))
+
+    def test_odometry_initial_guess(self):
+        # the nearest neighbours ICP from the key frame pose snaps to the wrong tooth of the comb
+        points = create_comb_points()
+        rotation = create_rotation_matrix_yx(10)
+        position = np.array([5., -16.])
+        moved_points = transform_points(points - position, rotation.T, target_type=float)
+        scans = [np.concatenate([scan, np.zeros((scan.shape[0], 1))], axis=1) for scan in [points, moved_points]]
+
+        # the odometry pose is noised by 2 degrees and 3 pixels
+        noised_rotation = create_rotation_matrix_yx(12)
+        noised_position = position + [3, 0]
+        for odometry_pose, expect_aligned in [(None, False), ((position, rotation), True),
+                                              ((noised_position, noised_rotation), True)]:
+            front_end = FrontEnd(200, 200, use_point_ids=False)
+            sensor = ReplaySensor()
+            odometry = ReplayOdometry() if odometry_pose is not None else None
+            sensor.update(scans[0])
+            if odometry is not None:
+                odometry.update(np.zeros(2), np.identity(3))
+            self.assertTrue(front_end.add_key_frame(sensor, odometry))
+            sensor.update(scans[1])
+            if odometry is not None:
+                odometry.update(*odometry_pose)
+            self.assertTrue(front_end.add_key_frame(sensor, odometry))
+
+            frame = front_end.get_frames()[-1]
+            aligned = np.allclose(frame.position[:2], position, rtol=0, atol=0.5) and \
+                np.allclose(frame.rotation, rotation, rtol=0, atol=1e-2)
+            self.assertEqual(aligned, expect_aligned)
+
+    def test_scan_matcher_odometry_guess(self):
+        # the motion is larger than the scan matcher window, the odometry guess centers the window near it
+        points = create_comb_points()
+        rotation = create_rotation_matrix_yx(25)
+        position = np.array([30., -35.])
+        moved_points = transform_points(points - position, rotation.T, target_type=float)
+        scans = [np.concatenate([scan, np.zeros((scan.shape[0], 1))], axis=1) for scan in [points, moved_points]]
+
+        noised_rotation = create_rotation_matrix_yx(21)
+        noised_position = position + [8, -6]
+        for odometry_pose, expect_aligned in [((np.zeros(2), np.identity(3)), False),
+                                              ((noised_position, noised_rotation), True)]:
+            front_end = FrontEnd(200, 200, use_point_ids=False, scan_matcher=CorrelativeScanMatcher())
+            sensor = ReplaySensor()
+            odometry = ReplayOdometry()
+            sensor.update(scans[0])
+            odometry.update(np.zeros(2), np.identity(3))
+            self.assertTrue(front_end.add_key_frame(sensor, odometry))
+            sensor.update(scans[1])
+            odometry.update(*odometry_pose)
+            front_end.add_key_frame(sensor, odometry)
+
+            frame = front_end.get_frames()[-1]
+            aligned = np.allclose(frame.position[:2], position, rtol=0, atol=0.5) and \
+                np.allclose(frame.rotation, rotation, rtol=0, atol=1e-2)
+            self.assertEqual(aligned, expect_aligned)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from playground.headless import Command, HeadlessSimulation, read_commands, write_commands
+from playground.odometry import Odometry
+from playground.sensor import Sensor
+from playground.slam.backend import BackEnd
+from playground.slam.frontend import FrontEnd
+from tests.world_tests import create_world
+
+
+class HeadlessTests(unittest.TestCase):
+
+    def test_read_write_commands(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            file_name = os.path.join(dir_name, 'commands.txt')
+            with open(file_name, 'w') as file:
+                file.write('# comment\nmove 10 2\n\nrotate -10\nloop_closure\n')
+            commands = read_commands(file_name)
+            self.assertEqual(commands, [(Command.MOVE, 10), (Command.MOVE, 10),
+                                        (Command.ROTATE, -10), (Command.LOOP_CLOSURE, 0)])
+
+            write_commands(file_name, commands)
+            self.assertEqual(read_commands(file_name), commands)
+
+    def test_run(self):
+        world = create_world(height=300, width=300)
+        odometry = Odometry(mu=0, sigma=0)
+        sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=0)
+        front_end = FrontEnd(world.height, world.width)
+        simulation = HeadlessSimulation(world, odometry, sensor, front_end, BackEnd(edge_sigma=0.5, angle_sigma=0.1))
+        commands = [(Command.MOVE, 10), (Command.ROTATE, 10), (Command.ROTATE, -10), (Command.MOVE, -10),
+                    (Command.LOOP_CLOSURE, 0)]
+        steps_per_second = simulation.run(commands)
+
+        self.assertGreater(steps_per_second, 0)
+        self.assertEqual(len(front_end.get_frames()), 5)
+        self.assertTrue(np.allclose(simulation.robot.position, [0, 0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+import unittest
+import numpy as np
+from hilbertcurve.hilbertcurve import HilbertCurve
+from playground.utils.hilbert import hilbert_distances
+
+
+class HilbertTests(unittest.TestCase):
+
+    def test_distances(self):
+        for p in [1, 3, 10]:
+            hilbert_curve = HilbertCurve(p=p, n=2)
+            points = np.random.default_rng(p).integers(0, 2 ** p, size=(100, 2))
+            expected = [hilbert_curve.distance_from_point(point) for point in points]
+            self.assertTrue(np.array_equal(hilbert_distances(points, p), expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
-from playground.slam.icp import ICP
+from scipy.spatial import cKDTree
+from playground.slam.icp import ICP, estimate_normals
 from playground.utils.transform import create_rotation_matrix_yx
 from playground.utils.transform import transform_points
 
@@ -108,6 +109,97 @@ class ICPTests(unittest.TestCase):
         self.assertTrue(np.allclose(points_a, points_b, rtol=0, atol=0.5))
         self.assertTrue(np.allclose(rotation, rot, rtol=0, atol=0.5))
 
+    def test_closed_form_rotation_translation(self):
+        points_a = np.array([[0, 0],
+                             [0, 5],
+                             [0, 10],
+                             [0, 15]])
+
+        rotation = create_rotation_matrix_yx(-45)
+        move_add = np.identity(3)
+        move_add[:2, 2] = [2., 2.]
+        tr = np.matmul(move_add, rotation)
+
+        points_b = transform_points(points_a, tr, target_type=float)
+
+        icp = ICP()
+        rot, pos, error = icp.find_closed_form_transform(points_a, points_b)
+
+        points_a = transform_points(points_a, rot, target_type=float)
+        points_a = points_a + pos
+
+        self.assertTrue(np.allclose(points_a, points_b))
+        self.assertTrue(np.allclose(rotation, rot))
+        self.assertTrue(np.isclose(error, 0))
+
+    def test_nearest_transform(self):
+        # L-shaped wall corner
+        wall = np.arange(0, 50, 2.)
+        points_a = np.vstack([np.stack([wall, np.zeros_like(wall)], axis=1),
+                              np.stack([np.zeros_like(wall), wall], axis=1)])
+
+        offset = np.array([0.5, -0.7])
+        points_b = points_a + offset
+
+        icp = ICP()
+        rot, pos, error = icp.find_nearest_transform(points_a, cKDTree(points_b))
+        self.assertTrue(np.allclose(offset, pos))
+        self.assertTrue(np.allclose(np.identity(3), rot))
+
+    def test_nearest_transform_point_to_line(self):
+        # L-shaped wall corner
+        wall = np.arange(0, 50, 2.)
+        points_a = np.vstack([np.stack([wall, np.zeros_like(wall)], axis=1),
+                              np.stack([np.zeros_like(wall), wall], axis=1)])
+
+        rotation = create_rotation_matrix_yx(5)
+        tr = rotation.copy()
+        tr[:2, 2] = [2., -3.]
+        points_b = transform_points(points_a, tr, target_type=float)
+        kd_tree = cKDTree(points_b)
+
+        icp = ICP()
+        rot, pos, error = icp.find_nearest_transform(points_a, kd_tree, estimate_normals(kd_tree))
+
+        points_a = transform_points(points_a, rot, target_type=float)
+        points_a = points_a + pos
+
+        self.assertTrue(np.allclose(points_a, points_b, rtol=0, atol=0.5))
+        self.assertTrue(np.allclose(rotation, rot, rtol=0, atol=0.01))
+
+    def test_mismatched_correspondences(self):
+        rng = np.random.default_rng(0)
+        points_a = rng.uniform(-100, 100, (100, 2))
+        tr = create_rotation_matrix_yx(3)
+        tr[:2, 2] = [4., -6.]
+        points_b = transform_points(points_a, tr, target_type=float)
+        points_b += rng.normal(0, 0.5, points_b.shape)
+        # every fifth correspondence is wrong
+        points_b[::5] = rng.uniform(-100, 100, (20, 2))
+
+        def get_error(icp):
+            rot, pos, _ = icp.find_transform(points_a, points_b)
+            return np.abs(rot[:2, :2] - tr[:2, :2]).max() + np.abs(pos - tr[:2, 2]).max()
+
+        least_squares_error = get_error(ICP(kernel=None))
+        self.assertGreater(least_squares_error, 1)
+        self.assertLess(get_error(ICP()), least_squares_error / 2)
+        self.assertLess(get_error(ICP(kernel='cauchy')), 0.1)
+        self.assertLess(get_error(ICP(kernel=None, trim_ratio=0.75)), 0.1)
+
+    def test_max_iterations(self):
+        points_a = np.array([[0, 0], [0, 5], [0, 10], [5, 15]])
+        tr = create_rotation_matrix_yx(-30)
+        tr[:2, 2] = [2, 3]
+        points_b = transform_points(points_a, tr, target_type=float)
+
+        # a single Gauss-Newton step isn't enough for a large rotation
+        rot, pos, error = ICP(max_iterations=1).find_transform(points_a, points_b)
+        self.assertGreater(error, 0.1)
+        rot, pos, error = ICP(max_iterations=100).find_transform(points_a, points_b)
+        self.assertLess(error, 1e-6)
+        self.assertTrue(np.allclose(pos, [2, 3], atol=1e-6))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import numpy as np
+from playground.headless import Command, HeadlessSimulation
+from playground.odometry import Odometry
+from playground.sensor import Sensor
+from playground.slam.backend import BackEnd
+from playground.slam.frontend import FrontEnd
+from playground.slam.loopdetector import DescriptorIndex, LoopDetector, compute_ring_descriptor
+from playground.utils.transform import create_rotation_matrix_yx, transform_points
+from tests.world_tests import create_world
+
+
+class LoopDetectorTests(unittest.TestCase):
+
+    def test_descriptor_index(self):
+        rng = np.random.default_rng(0)
+        descriptors = rng.random((100, 8))
+        index = DescriptorIndex(buffer_size=4)
+        for i, descriptor in enumerate(descriptors):
+            index.add(i, descriptor)
+            self.assertEqual(len(index), i + 1)
+
+            # the same neighbours as the brute force search over added descriptors
+            query = rng.random(8)
+            distances = np.linalg.norm(descriptors[:i + 1] - query, axis=1)
+            expected = np.argsort(distances)[:3]
+            result = index.query(query, k=3)
+            self.assertEqual([item_id for _, item_id in result], expected.tolist())
+            self.assertTrue(np.allclose([distance for distance, _ in result], distances[expected]))
+
+        max_distance = np.mean(np.sort(np.linalg.norm(descriptors - 0.5, axis=1))[1:3])
+        self.assertEqual(len(index.query(np.full(8, 0.5), k=5, max_distance=max_distance)), 2)
+
+    def test_ring_descriptor(self):
+        points = np.array([[10, 0], [0, 30], [-50, 50], [200, 10]])
+        descriptor = compute_ring_descriptor(points, num_rings=10, max_range=100)
+        self.assertTrue(np.allclose(descriptor, [0, 0.25, 0, 0.25, 0, 0, 0, 0.25, 0, 0]))
+
+        # the sensor rotation doesn't change the descriptor
+        rotated = transform_points(points, create_rotation_matrix_yx(30), target_type=float)
+        self.assertTrue(np.allclose(compute_ring_descriptor(rotated, num_rings=10, max_range=100), descriptor))
+
+    def test_recent_frames_are_skipped(self):
+        detector = LoopDetector(num_rings=4, max_range=100, min_frame_gap=3, min_loop_interval=2)
+        points = np.array([[10, 0], [40, 0]])
+        for _ in range(4):
+            self.assertEqual(detector.add_frame(points), [])
+        self.assertEqual(detector.add_frame(points), [0])
+        self.assertEqual(detector.add_frame(np.array([[90, 0]])), [])
+
+        # the confirmed loop closure suppresses candidates of the next frames
+        detector.confirm_loop_closure(5)
+        self.assertEqual(detector.add_frame(points), [])
+        self.assertEqual(sorted(detector.add_frame(points)), [0, 1, 2])
+        self.assertEqual(detector.num_frames, 8)
+
+    def test_loop_closure_detection(self):
+        world = create_world(height=300, width=300)
+        sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=0)
+        detector = LoopDetector(min_frame_gap=5)
+        front_end = FrontEnd(world.height, world.width, loop_detector=detector)
+        loop_frames = []
+
+        class RecordingBackEnd(BackEnd):
+            def update_frames(self, frames, loop_frame, progress_callback=None):
+                loop_frames.append((len(frames) - 1, loop_frame))
+                super().update_frames(frames, loop_frame, progress_callback)
+
+        simulation = HeadlessSimulation(world, Odometry(mu=0, sigma=0), sensor, front_end,
+                                        RecordingBackEnd(edge_sigma=0.5, angle_sigma=0.1))
+        simulation.run([(Command.MOVE, 10)] * 6 + [(Command.MOVE, -10)] * 6)
+        self.assertGreater(len(loop_frames), 0)
+
+        # the loop closure pose relative to the candidate frame agrees with the real robot poses
+        frame_index, loop_frame = loop_frames[0]
+        self.assertLess(loop_frame.reference_index, frame_index - 5)
+        ground_truth = simulation.ground_truth
+        expected = ground_truth[frame_index][:2] - ground_truth[loop_frame.reference_index][:2]
+        self.assertTrue(np.allclose(loop_frame.relative_icp_position[:2], expected, atol=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
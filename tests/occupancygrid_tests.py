@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+from playground.slam.frame import Frame
+from playground.slam.occupancygrid import OccupancyGrid
+
+
+class OccupancyGridTests(unittest.TestCase):
+
+    def test_insert_scan(self):
+        grid = OccupancyGrid(200, 300, tile_size=32)
+        # a wall at y=50 observed from the origin
+        points = np.stack([np.full(21, 50), np.arange(-10, 11)], axis=1)
+        grid.insert_scan(np.array([0, 0]), points)
+
+        self.assertTrue(np.all(grid.get_log_odds(points) > 0))
+        free = np.stack([np.arange(0, 50), np.zeros(50, dtype=int)], axis=1)
+        self.assertTrue(np.all(grid.get_log_odds(free) < 0))
+        # cells behind the wall and outside the map stay unknown
+        self.assertTrue(np.all(grid.get_log_odds([[60, 0], [0, 100], [500, 500]]) == 0))
+        self.assertTrue(np.allclose(grid.get_probabilities([[60, 0]]), 0.5))
+
+        # only tiles crossed by the rays are allocated
+        self.assertEqual(grid.num_tiles, 4)
+        image = grid.image
+        self.assertLess(image[100 - 50, 150], image[100 - 60, 150])
+        self.assertGreater(image[100 - 25, 150], image[100 - 60, 150])
+
+        # log-odds are accumulated and saturated
+        for _ in range(200):
+            grid.insert_scan(np.array([0, 0]), points)
+        self.assertAlmostEqual(grid.get_log_odds(points[:1])[0], 5)
+        self.assertAlmostEqual(grid.get_log_odds(free[10:11])[0], -5)
+
+        grid.clear()
+        self.assertEqual(grid.num_tiles, 0)
+        self.assertTrue(np.all(grid.get_log_odds(points) == 0))
+
+    def test_insert_frame(self):
+        grid = OccupancyGrid(200, 300)
+        frame = Frame(np.array([[0, 40, 1], [5, 40, 2]]))
+        frame.position = np.array([10., 20., 0.])
+        frame.rotation = np.array([[0., -1., 0.], [1., 0., 0.], [0., 0., 1.]])
+        grid.insert_frame(frame)
+        # points are rotated and moved with the frame pose
+        self.assertTrue(np.all(grid.get_log_odds([[-30, 20], [-30, 25]]) > 0))
+        self.assertLess(grid.get_log_odds([[0, 20]])[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
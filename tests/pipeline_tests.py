@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from playground.headless import Command, HeadlessSimulation
+from playground.odometry import Odometry
+from playground.pipeline import in_process, threaded
+from playground.recording import LogReader, LogWriter
+from playground.sensor import Sensor
+from playground.slam.backend import BackEnd
+from playground.slam.frontend import FrontEnd
+from tests.world_tests import create_world
+
+
+def fail_after(num_items):
+    yield from range(num_items)
+    raise RuntimeError('source failed')
+
+
+def exit_after(num_items):
+    # the process exits without the end of stream like on a signal
+    yield from range(num_items)
+    os._exit(3)
+
+
+def run_simulation(world, threaded_simulation, log_writer=None):
+    rng = np.random.default_rng(5)
+    odometry = Odometry(mu=0, sigma=1, rng=rng)
+    sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=1, rng=rng)
+    front_end = FrontEnd(world.height, world.width)
+    simulation = HeadlessSimulation(world, odometry, sensor, front_end, BackEnd(edge_sigma=0.5, angle_sigma=0.1),
+                                    log_writer)
+    commands = [(Command.MOVE, 10), (Command.ROTATE, 10), (Command.ROTATE, -10), (Command.MOVE, -10),
+                (Command.LOOP_CLOSURE, 0)]
+    simulation.run(commands, threaded_simulation=threaded_simulation)
+    return front_end.get_frames()
+
+
+class PipelineTests(unittest.TestCase):
+
+    def test_threaded(self):
+        self.assertEqual(list(threaded(range(100), max_size=3)), list(range(100)))
+        # the consumer can stop early
+        items = threaded(range(100), max_size=3)
+        self.assertEqual([next(items) for _ in range(5)], list(range(5)))
+        items.close()
+        # errors are passed to the consumer
+        with self.assertRaises(RuntimeError):
+            list(threaded(fail_after(10)))
+
+    def test_threaded_simulation(self):
+        world = create_world(height=300, width=300)
+        frames = run_simulation(world, threaded_simulation=False)
+        threaded_frames = run_simulation(world, threaded_simulation=True)
+        self.assertEqual(len(threaded_frames), len(frames))
+        for frame, threaded_frame in zip(frames, threaded_frames):
+            self.assertTrue(np.array_equal(frame.observed_points, threaded_frame.observed_points))
+            self.assertTrue(np.allclose(frame.position, threaded_frame.position))
+
+    def test_in_process(self):
+        world = create_world(height=300, width=300)
+        with tempfile.TemporaryDirectory() as dir_name:
+            file_name = os.path.join(dir_name, 'log.slamlog')
+            with LogWriter(file_name, world.height, world.width) as log_writer:
+                run_simulation(world, threaded_simulation=False, log_writer=log_writer)
+            steps = list(LogReader(file_name))
+            process_steps = list(in_process(LogReader, file_name, max_size=2))
+
+        self.assertEqual(len(process_steps), len(steps))
+        for step, process_step in zip(steps, process_steps):
+            self.assertTrue(np.array_equal(step.scan, process_step.scan))
+            self.assertTrue(np.array_equal(step.robot_position, process_step.robot_position))
+
+    def test_in_process_errors(self):
+        # the factory error is raised in the parent process
+        with self.assertRaises(FileNotFoundError):
+            list(in_process(LogReader, os.path.join(tempfile.gettempdir(), 'nonexistent.slamlog')))
+        with self.assertRaises(RuntimeError):
+            list(in_process(fail_after, 3))
+
+        items = []
+        with self.assertRaises(RuntimeError):
+            for item in in_process(exit_after, 3):
+                items.append(item)
+        # items which weren't flushed before the exit are lost
+        self.assertEqual(items, list(range(len(items))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 import math
 import unittest
 import numpy as np
+from playground.slam.backend import BackEnd
+from playground.slam.frame import Frame, get_relative_odometry
+from playground.slam.gtsambackend import GTSAMBackEnd
 from playground.slam.posegraph import PoseGraph
-from playground.utils.transform import create_rotation_matrix_yx
+from playground.utils.transform import create_rotation_matrix_yx, t2v, v2t
 
 
 def fill_vertices(prior_pose_index, pose_graph):
@@ -22,6 +25,43 @@ def fill_edges(prior_pose_index, pose_graph):
     pose_graph.add_factor_edge(prior_pose_index + 5, prior_pose_index + 2, 2, 0, math.pi / 2)
 
 
+def build_linear_system_per_edge(values, factors):
+    """
+    Reference normal equations assembled edge by edge, factors are (i, j, transform, noise model) tuples
+    """
+    num_params = 3
+    h = np.zeros((len(values) * num_params, len(values) * num_params))
+    b = np.zeros(len(values) * num_params)
+    for index_i, index_j, factor_transform, noise_model in factors:
+        v_i = values[index_i]
+        v_j = values[index_j]
+        t_i = v2t(v_i)
+        t_z = v2t(factor_transform)
+        error = t2v(np.linalg.inv(t_z) @ (np.linalg.inv(t_i) @ v2t(v_j)))[:, 0]
+        error[2] = (error[2] + np.pi) % (2 * np.pi) - np.pi
+
+        si = np.sin(v_i[2])
+        ci = np.cos(v_i[2])
+        dr_i = np.array([[-si, ci], [-ci, -si]]).T
+        dt_ij = np.array([v_j[:2] - v_i[:2]]).T
+        r_i = t_i[:2, :2]
+        r_z = t_z[:2, :2]
+        a_ij = np.vstack((np.hstack((-r_z.T @ r_i.T, (r_z.T @ dr_i.T) @ dt_ij)), [0, 0, -1]))
+        b_ij = np.vstack((np.hstack((r_z.T @ r_i.T, np.zeros((2, 1)))), [0, 0, 1]))
+
+        block_i = slice(num_params * index_i, num_params * (index_i + 1))
+        block_j = slice(num_params * index_j, num_params * (index_j + 1))
+        h[block_i, block_i] += a_ij.T @ noise_model @ a_ij
+        h[block_i, block_j] += a_ij.T @ noise_model @ b_ij
+        h[block_j, block_i] += (a_ij.T @ noise_model @ b_ij).T
+        h[block_j, block_j] += b_ij.T @ noise_model @ b_ij
+        b[block_i] -= a_ij.T @ noise_model @ error
+        b[block_j] -= b_ij.T @ noise_model @ error
+    # the 1st vertex is fixed
+    h[:num_params, :num_params] += np.eye(num_params)
+    return h, b
+
+
 class PoseGraphTests(unittest.TestCase):
     def test_add_vertex(self):
         pose_graph = PoseGraph(edge_sigma_x=0.2, edge_sigma_y=0.2, edge_sigma_angle=0.1)
@@ -91,6 +131,40 @@ class PoseGraphTests(unittest.TestCase):
         self.assertTrue(np.allclose(pose2, [0., 1., 0.]))
         self.assertTrue(np.allclose(pose3, [0., 2., 0.]))
 
+    def test_linear_system(self):
+        pose_graph = PoseGraph(edge_sigma_x=0.2, edge_sigma_y=0.3, edge_sigma_angle=0.1)
+        prior_pose_index = pose_graph.prior_pose_index
+        fill_vertices(prior_pose_index, pose_graph)
+        fill_edges(prior_pose_index, pose_graph)
+        pose_graph.add_odometry_edge(prior_pose_index + 1, prior_pose_index + 3, 4, 0.5, math.pi / 2)
+
+        values = [pose_graph.get_vector_pose_at(prior_pose_index + index) for index in range(1, 6)]
+        noise_model = np.linalg.inv(np.diag([0.3, 0.2, 0.1]))
+        odometry_noise_model = np.linalg.inv(np.diag([3., 3., 0.3]))
+        factors = [(0, 1, [2, 0, 0], noise_model), (1, 2, [2, 0, math.pi / 2], noise_model),
+                   (2, 3, [2, 0, math.pi / 2], noise_model), (3, 4, [2, 0, math.pi / 2], noise_model),
+                   (4, 1, [2, 0, math.pi / 2], noise_model), (0, 2, [4, 0.5, math.pi / 2], odometry_noise_model)]
+        expected_h, expected_b = build_linear_system_per_edge(values, factors)
+
+        h, b = pose_graph.get_linear_system()
+        self.assertTrue(np.allclose(h.toarray(), expected_h))
+        self.assertTrue(np.allclose(b, expected_b))
+
+    def test_singular_system(self):
+        pose_graph = PoseGraph(edge_sigma_x=1.0, edge_sigma_y=1.0, edge_sigma_angle=1.0)
+        prior_pose_index = pose_graph.prior_pose_index
+        pose_graph.add_vertex(prior_pose_index + 1, tx=0.0, ty=0.0, rot=0.0)
+        pose_graph.add_vertex(prior_pose_index + 2, tx=0.0, ty=1.5, rot=0.1)
+        # the last vertex has no edges, so the normal equations are singular
+        pose_graph.add_vertex(prior_pose_index + 3, tx=3.0, ty=2.0, rot=0.2)
+        pose_graph.add_factor_edge(prior_pose_index + 1, prior_pose_index + 2, 0, 1, 0)
+
+        # the optimization stops without an error and keeps the current values
+        pose_graph.optimize()
+        self.assertTrue(np.allclose(pose_graph.get_vector_pose_at(prior_pose_index + 1), [0., 0., 0.]))
+        self.assertTrue(np.allclose(pose_graph.get_vector_pose_at(prior_pose_index + 2), [0., 1.5, 0.1]))
+        self.assertTrue(np.allclose(pose_graph.get_vector_pose_at(prior_pose_index + 3), [3., 2., 0.2]))
+
     def test_rotation(self):
         pose_graph = PoseGraph(edge_sigma_x=1.0, edge_sigma_y=1.0, edge_sigma_angle=1.0)
         prior_pose_index = pose_graph.prior_pose_index
@@ -99,4 +173,106 @@ class PoseGraphTests(unittest.TestCase):
         pose_graph.add_vertex(prior_pose_index + 1, tx=0.0, ty=0.0, rot=rot)
 
         pose1 = pose_graph.get_vector_pose_at(prior_pose_index + 1)
-        self.assertIsNotNone(pose1)
\ No newline at end of file
+        self.assertIsNotNone(pose1)
+
+    def test_extra_edges(self):
+        def make_frame(key_frame, position, angle):
+            # the frame pose is composed like in the front end
+            frame = Frame(np.zeros((1, 3)))
+            frame.relative_icp_position = np.array(position, dtype=float)
+            frame.relative_icp_rotation = create_rotation_matrix_yx(angle)
+            frame.rotation = frame.relative_icp_rotation @ key_frame.rotation
+            frame.position = key_frame.rotation @ np.array([position[0], position[1], 0.]) + key_frame.position
+            return frame
+
+        def get_last_frame_error(back_end):
+            frames = [Frame(np.zeros((1, 3)))]
+            frames.append(make_frame(frames[0], [10, 3], 20))
+            frames.append(make_frame(frames[1], [8, -4], -35))
+            frames.append(make_frame(frames[2], [5, 6], 15))
+            # the consistent edge from the second frame to the last one
+            rotation = frames[3].rotation @ frames[1].rotation.T
+            position = (frames[1].rotation.T @ (frames[3].position - frames[1].position))[:2]
+            frames[3].extra_edges = [(1, position, rotation)]
+            expected_position = frames[3].position[:2].copy()
+
+            # only the edge from the previous frame is noised
+            frames[3].relative_icp_position = frames[3].relative_icp_position + [2, 0]
+            loop_frame = Frame(np.zeros((1, 3)))
+            loop_frame.reference_index = 3
+            back_end.update_frames(frames, loop_frame)
+            return np.linalg.norm(frames[3].position[:2] - expected_position)
+
+        for back_end_type in [BackEnd, GTSAMBackEnd]:
+            error = get_last_frame_error(back_end_type(edge_sigma=0.5, angle_sigma=0.1))
+            self.assertAlmostEqual(error, 2, delta=0.1)
+            error = get_last_frame_error(back_end_type(edge_sigma=0.5, angle_sigma=0.1, extra_edges=True))
+            self.assertLess(error, 1.5)
+
+    def test_odometry_edges(self):
+        def get_last_frame_error(back_end):
+            # odometry poses are the true frame poses
+            frames = []
+            for position, angle in [([0, 0], 0), ([10, 3], 20), ([15, -4], -15), ([20, 6], 0)]:
+                frame = Frame(np.zeros((1, 3)))
+                frame.odometry_position = np.array(position, dtype=float)
+                frame.odometry_rotation = create_rotation_matrix_yx(angle)
+                frame.position = np.array(position + [0], dtype=float)
+                frame.rotation = frame.odometry_rotation.copy()
+                if len(frames) > 0:
+                    frame.relative_icp_rotation, frame.relative_icp_position = get_relative_odometry(frame, frames[-1])
+                frames.append(frame)
+            expected_position = frames[3].position[:2].copy()
+
+            # only the last ICP edge is noised
+            frames[3].relative_icp_position = frames[3].relative_icp_position + [2, 0]
+            loop_frame = Frame(np.zeros((1, 3)))
+            loop_frame.reference_index = 3
+            back_end.update_frames(frames, loop_frame)
+            return np.linalg.norm(frames[3].position[:2] - expected_position)
+
+        for back_end_type in [BackEnd, GTSAMBackEnd]:
+            error = get_last_frame_error(back_end_type(edge_sigma=0.5, angle_sigma=0.1))
+            self.assertAlmostEqual(error, 2, delta=0.1)
+            error = get_last_frame_error(back_end_type(edge_sigma=0.5, angle_sigma=0.1, odometry_edges=True,
+                                                       odometry_sigma=0.5))
+            self.assertLess(error, 1.5)
+
+    def test_incremental_update(self):
+        def make_frames(num_frames):
+            # frames go around a square, the loop edge from the last frame to the first one is noised
+            frames = [Frame(np.zeros((1, 3)))]
+            for index in range(1, num_frames):
+                key_frame = frames[-1]
+                frame = Frame(np.zeros((1, 3)))
+                frame.relative_icp_position = np.array([10., 1.])
+                frame.relative_icp_rotation = create_rotation_matrix_yx(360 / num_frames)
+                frame.rotation = frame.relative_icp_rotation @ key_frame.rotation
+                frame.position = key_frame.rotation @ np.array([10., 1., 0.]) + key_frame.position
+                frames.append(frame)
+            loop_frame = Frame(np.zeros((1, 3)))
+            loop_frame.reference_index = 0
+            loop_frame.relative_icp_rotation = frames[0].rotation @ frames[-1].rotation.T
+            loop_frame.relative_icp_position = (frames[-1].rotation.T @ (frames[0].position - frames[-1].position))[:2]
+            loop_frame.relative_icp_position += [3, -2]
+            return frames, loop_frame
+
+        def get_poses(frames):
+            return np.array([np.concatenate([frame.position[:2], frame.rotation[:2, 0]]) for frame in frames])
+
+        for back_end_type in [BackEnd, GTSAMBackEnd]:
+            frames, loop_frame = make_frames(8)
+            back_end_type(edge_sigma=0.5, angle_sigma=0.1).update_frames(frames, loop_frame)
+            batch_poses = get_poses(frames)
+
+            frames, loop_frame = make_frames(8)
+            back_end = back_end_type(edge_sigma=0.5, angle_sigma=0.1, incremental=True)
+            back_end.update_frames(frames, loop_frame)
+            poses = get_poses(frames)
+            self.assertTrue(np.allclose(poses, batch_poses, rtol=0, atol=1e-2))
+
+            # the same loop closure and no new frames add nothing to the graph
+            back_end.update_frames(frames, loop_frame)
+            self.assertTrue(np.allclose(get_poses(frames), poses, rtol=0, atol=1e-6))
+            back_end.update_frames(frames, loop_frame)
+            self.assertTrue(np.allclose(get_poses(frames), poses, rtol=0, atol=1e-6))
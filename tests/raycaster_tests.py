@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from skimage.draw import line_aa
+from playground.environment.raycaster import RayCaster
+from tests.world_tests import create_world
+
+
+def cast_ray(start_pos, end_pos, world):
+    ys, xs, _ = line_aa(start_pos[0], start_pos[1], end_pos[0], end_pos[1])
+    for pos in zip(ys, xs):
+        is_obstacle, obstacle_id = world.is_obstacle(pos)
+        if is_obstacle:
+            return pos, obstacle_id
+    return None, None
+
+
+class RayCasterTests(unittest.TestCase):
+
+    def test_first_hit(self):
+        world = create_world()
+        start_pos = np.array([3, -7])
+        theta = np.linspace(0, 2 * np.pi, 100)
+        directions = np.stack([np.cos(theta), np.sin(theta)], axis=1)
+        end_positions = (start_pos + directions * 250).astype(int)
+
+        ray_caster = RayCaster()
+        coords, ids = ray_caster.cast(start_pos, end_positions, world)
+
+        expected = [cast_ray(start_pos, end_pos, world) for end_pos in end_positions]
+        expected_coords = np.array([pos for pos, _ in expected if pos is not None])
+        expected_ids = np.array([obstacle_id for _, obstacle_id in expected if obstacle_id is not None])
+        self.assertTrue(np.array_equal(coords, expected_coords))
+        self.assertTrue(np.array_equal(ids, expected_ids))
+
+    def test_no_hits(self):
+        world = create_world()
+        start_pos = np.array([0, 0])
+        end_positions = np.array([[10, 10], [-10, 0]])
+
+        ray_caster = RayCaster()
+        coords, ids = ray_caster.cast(start_pos, end_positions, world)
+        self.assertEqual(coords.shape, (0, 2))
+        self.assertEqual(ids.shape, (0,))
+
+
+if __name__ == '__main__':
+    unittest.main()
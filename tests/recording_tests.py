@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from playground.headless import Command, HeadlessSimulation
+from playground.odometry import Odometry
+from playground.recording import LogReader, LogReplay, LogWriter
+from playground.sensor import Sensor
+from playground.slam.backend import BackEnd
+from playground.slam.frontend import FrontEnd
+from tests.world_tests import create_world
+
+
+class RecordingTests(unittest.TestCase):
+
+    def test_record_replay(self):
+        world = create_world(height=300, width=300)
+        rng = np.random.default_rng(3)
+        odometry = Odometry(mu=0, sigma=1, rng=rng)
+        sensor = Sensor(dist_range=350, fov=90, mu=0, sigma=1, rng=rng)
+        front_end = FrontEnd(world.height, world.width)
+        commands = [(Command.MOVE, 10), (Command.ROTATE, 10), (Command.ROTATE, -10), (Command.MOVE, -10),
+                    (Command.LOOP_CLOSURE, 0)]
+
+        with tempfile.TemporaryDirectory() as dir_name:
+            file_name = os.path.join(dir_name, 'log.slamlog')
+            # a small chunk size makes the log to have many chunks
+            with LogWriter(file_name, world.height, world.width, chunk_size=2) as log_writer:
+                simulation = HeadlessSimulation(world, odometry, sensor, front_end,
+                                                BackEnd(edge_sigma=0.5, angle_sigma=0.1), log_writer)
+                simulation.run(commands)
+
+            log_reader = LogReader(file_name)
+            self.assertEqual((log_reader.height, log_reader.width), (300, 300))
+            steps = list(log_reader)
+            self.assertEqual(len(steps), len(commands) + 1)
+            self.assertEqual([step.loop_closure for step in steps], [False] * 5 + [True])
+            self.assertTrue(np.allclose(steps[-1].robot_position, simulation.robot.position))
+            self.assertTrue(np.allclose(steps[-1].odometry_rotation, odometry.rotation))
+
+            replay_front_end = FrontEnd(log_reader.height, log_reader.width)
+            replay = LogReplay(replay_front_end, BackEnd(edge_sigma=0.5, angle_sigma=0.1))
+            self.assertGreater(replay.run(log_reader), 0)
+
+        # the replay gives the same frames as the simulation
+        frames = front_end.get_frames()
+        replay_frames = replay_front_end.get_frames()
+        self.assertEqual(len(replay_frames), len(frames))
+        for frame, replay_frame in zip(frames, replay_frames):
+            self.assertTrue(np.array_equal(frame.observed_points, replay_frame.observed_points))
+            self.assertTrue(np.allclose(frame.position, replay_frame.position))
+        self.assertTrue(np.allclose(replay.ground_truth, simulation.ground_truth))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import numpy as np
+from scipy.spatial import cKDTree
+from playground.slam.frame import Frame
+from playground.slam.icp import ICP, estimate_normals
+from playground.slam.scanmatcher import CorrelativeScanMatcher
+from playground.utils.transform import create_rotation_matrix_yx, transform_points
+
+
+def create_room_points():
+    """
+    Walls of a room with a column, the shape doesn't have symmetries
+    """
+    steps = np.arange(0, 100, 2)
+    walls = [np.stack([np.zeros_like(steps), steps], axis=1),
+             np.stack([steps * 0.6, np.zeros_like(steps)], axis=1),
+             np.stack([steps * 0.6, np.full_like(steps, 100)], axis=1),
+             np.stack([np.full_like(steps[:30], 60), steps[:30]], axis=1),
+             np.stack([30 + steps[:8], np.full_like(steps[:8], 70)], axis=1)]
+    return np.concatenate(walls).astype(float) - [30, 50]
+
+
+def create_comb_points():
+    """
+    Teeth of a comb with a base and a side wall, parallel teeth are 10 pixels apart,
+    so the nearest neighbours ICP snaps to the wrong tooth after a large step
+    """
+    steps = np.arange(0, 40, 2.)
+    teeth = [np.stack([steps, np.full_like(steps, x)], axis=1) for x in range(0, 120, 10)]
+    base = np.stack([np.full(60, -5.), np.arange(0, 120, 2.)], axis=1)
+    side = np.stack([np.arange(-5, 40, 2.), np.full(23, -10.)], axis=1)
+    return np.concatenate(teeth + [base, side]) - [20, 60]
+
+
+class CorrelativeScanMatcherTests(unittest.TestCase):
+
+    def test_known_transform(self):
+        points = create_room_points()
+        rot = create_rotation_matrix_yx(-6)
+        pos = np.array([11., -7.])
+        reference_frame = Frame(transform_points(points, rot, target_type=float) + pos)
+
+        matcher = CorrelativeScanMatcher()
+        found_rot, found_pos, score = matcher.match(points, reference_frame)
+        self.assertTrue(np.allclose(rot, found_rot, rtol=0, atol=1e-6))
+        self.assertTrue(np.allclose(pos, found_pos, rtol=0, atol=1))
+        self.assertGreater(score, 0.9)
+
+    def test_brute_force(self):
+        rng = np.random.default_rng(0)
+        points = create_room_points()
+        matcher = CorrelativeScanMatcher(linear_window=8, angular_window=4, coarse_angular_step=1, block_size=4)
+        for _ in range(3):
+            rot = create_rotation_matrix_yx(rng.uniform(-4, 4))
+            pos = rng.uniform(-8, 8, 2)
+            noised = points + rng.normal(0, 1, points.shape)
+            reference_frame = Frame(transform_points(noised, rot, target_type=float) + pos)
+            _, _, score = matcher.match(points, reference_frame)
+
+            # the branch and bound finds the best score of all rotations and translations,
+            # every single pose is scored with the matcher without the search window
+            pose_matcher = CorrelativeScanMatcher(linear_window=0, angular_window=0, block_size=1)
+            best_score = 0
+            for angle in range(-4, 5):
+                rotated = transform_points(points, create_rotation_matrix_yx(angle), target_type=float)
+                for dy in range(-8, 9):
+                    for dx in range(-8, 9):
+                        _, _, pose_score = pose_matcher.match(rotated + [dy, dx], reference_frame)
+                        best_score = max(best_score, pose_score)
+            self.assertAlmostEqual(score, best_score, places=3)
+
+    def test_window_bounds(self):
+        points = create_room_points()
+        matcher = CorrelativeScanMatcher(linear_window=8, angular_window=4, coarse_angular_step=1, block_size=4)
+        # the transform is a few pixels outside of the window, the last blocks reach past it
+        for pos in [np.array([11., 10.]), np.array([-11., -10.])]:
+            _, found_pos, _ = matcher.match(points, Frame(points + pos))
+            self.assertTrue(np.array_equal(found_pos, np.sign(pos) * 8))
+
+    def test_initial_guess(self):
+        points = create_comb_points()
+        rot = create_rotation_matrix_yx(10)
+        pos = np.array([-5., 16.])
+        points_b = transform_points(points, rot, target_type=float) + pos
+        kd_tree = cKDTree(points_b)
+        normals = estimate_normals(kd_tree)
+        icp = ICP()
+
+        # the nearest neighbours ICP from the identity snaps to the wrong wall
+        _, found_pos, error = icp.find_nearest_transform(points, kd_tree, normals)
+        self.assertFalse(np.allclose(pos, found_pos, rtol=0, atol=1))
+        self.assertGreater(error, 1)
+
+        initial_guess = CorrelativeScanMatcher().match(points, Frame(points_b))[:2]
+        found_rot, found_pos, error = icp.find_nearest_transform(points, kd_tree, normals, initial_guess=initial_guess)
+        self.assertTrue(np.allclose(rot[:2, :2], found_rot[:2, :2], rtol=0, atol=0.01))
+        self.assertTrue(np.allclose(pos, found_pos, rtol=0, atol=0.5))
+        self.assertLess(error, 0.5)
+
+    def test_search_around_initial_guess(self):
+        points = create_room_points()
+        rot = create_rotation_matrix_yx(25)
+        pos = np.array([40., -35.])
+        reference_frame = Frame(transform_points(points, rot, target_type=float) + pos)
+        matcher = CorrelativeScanMatcher()
+
+        # the transform is outside of the search window around the identity
+        found_rot, found_pos, _ = matcher.match(points, reference_frame)
+        self.assertFalse(np.allclose(pos, found_pos, rtol=0, atol=1))
+
+        # the guess is 3 degrees and a few pixels off, the window around it contains the transform
+        initial_guess = create_rotation_matrix_yx(22), pos + [6, -4]
+        found_rot, found_pos, score = matcher.match(points, reference_frame, initial_guess=initial_guess)
+        self.assertTrue(np.allclose(rot, found_rot, rtol=0, atol=1e-6))
+        self.assertTrue(np.allclose(pos, found_pos, rtol=0, atol=1))
+        self.assertGreater(score, 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
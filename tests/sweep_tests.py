@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from playground.headless import Command, write_commands
+from playground.sweep import SweepJob, absolute_trajectory_error, relative_pose_error, run_job, run_sweep, summarize
+from tests.world_tests import create_world
+
+
+class SweepTests(unittest.TestCase):
+
+    def test_errors(self):
+        ground_truth = np.array([[0, 0], [0, 10], [10, 10]])
+        positions = np.array([[0, 0], [0, 13], [10, 14]])
+        self.assertAlmostEqual(absolute_trajectory_error(positions, ground_truth), np.sqrt(25 / 3))
+        self.assertAlmostEqual(relative_pose_error(positions, ground_truth), 2)
+
+    def test_run_job(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            map_file_name = os.path.join(dir_name, 'map.png')
+            create_world(300, 300, map_file_name)
+            commands_file_name = os.path.join(dir_name, 'commands.txt')
+            write_commands(commands_file_name, [(Command.MOVE, 10), (Command.ROTATE, 10), (Command.ROTATE, -10),
+                                                (Command.MOVE, -10), (Command.LOOP_CLOSURE, 0)])
+
+            job = SweepJob(map_file_name, commands_file_name, odometry_sigma=3, sensor_sigma=1, edge_sigma=0.5,
+                           angle_sigma=0.1, backend='basic', seed=7)
+            results = [run_job(job), run_job(job)]
+
+        # the same seed gives the same noise
+        self.assertEqual(results[0]['num_frames'], 5)
+        self.assertEqual(results[0]['ate'], results[1]['ate'])
+        self.assertEqual(results[0]['rpe'], results[1]['rpe'])
+
+        summary = summarize(results)
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]['num_runs'], 2)
+        self.assertIsNone(summary[0]['job'].seed)
+        self.assertAlmostEqual(summary[0]['ate_std'], 0)
+
+    def test_run_sweep(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            map_file_name = os.path.join(dir_name, 'map.png')
+            create_world(300, 300, map_file_name)
+            commands_file_name = os.path.join(dir_name, 'commands.txt')
+            write_commands(commands_file_name, [(Command.MOVE, 10), (Command.ROTATE, 10), (Command.LOOP_CLOSURE, 0)])
+
+            jobs = [SweepJob(map_file_name, commands_file_name, odometry_sigma=3, sensor_sigma=1, edge_sigma=edge_sigma,
+                             angle_sigma=0.1, backend='basic', seed=3) for edge_sigma in [0.5, 1.0]]
+            results = run_sweep(jobs, num_workers=2)
+
+        # results come from worker processes in the jobs order
+        self.assertEqual([result['job'] for result in results], jobs)
+        for result in results:
+            self.assertEqual(result['num_frames'], 3)
+            self.assertTrue(np.isfinite(result['ate']))
+
+        summary = summarize(results)
+        self.assertEqual([group['job'].edge_sigma for group in summary], [0.5, 1.0])
+        self.assertEqual([group['num_runs'] for group in summary], [1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
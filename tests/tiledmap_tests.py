@@ -0,0 +1,48 @@
+import unittest
+import numpy as np
+from playground.utils.tiledmap import TiledMap
+
+
+class TiledMapTests(unittest.TestCase):
+
+    def test_set_get(self):
+        tiled_map = TiledMap(tile_size=8, fill_value=255)
+        cells = np.array([[0, 0], [-1, -1], [7, 8], [-100, 300]])
+        tiled_map.set(cells, [1, 2, 3, 4])
+        self.assertEqual(tiled_map.num_tiles, 4)
+        self.assertEqual(tiled_map.get(cells).tolist(), [1, 2, 3, 4])
+        # not allocated tiles and not written cells have the fill value
+        self.assertEqual(tiled_map.get([[1, 1], [1000, -1000]]).tolist(), [255, 255])
+        self.assertEqual(tiled_map.num_tiles, 4)
+
+        tiled_map.clear()
+        self.assertEqual(tiled_map.num_tiles, 0)
+        self.assertEqual(tiled_map.get(cells).tolist(), [255] * 4)
+
+    def test_add(self):
+        tiled_map = TiledMap(tile_size=4, dtype=np.int8)
+        cells = np.array([[0, 0], [5, -3]])
+        for _ in range(10):
+            values = tiled_map.add(cells, [20, -20], min_value=-100, max_value=100)
+        self.assertEqual(values.tolist(), [100, -100])
+        self.assertEqual(tiled_map.get(cells).tolist(), [100, -100])
+
+    def test_window(self):
+        rng = np.random.default_rng(0)
+        dense = rng.integers(0, 255, size=(50, 70), dtype=np.uint8)
+        rows, cols = np.indices(dense.shape)
+        cells = np.stack([rows.ravel() - 20, cols.ravel() - 30], axis=1)
+        # a small number of hot tiles makes the map to compress and restore tiles
+        tiled_map = TiledMap(tile_size=16, max_hot_tiles=3)
+        tiled_map.set(cells, dense.ravel())
+
+        self.assertTrue(np.array_equal(tiled_map.get_window(-20, -30, 50, 70), dense))
+        self.assertTrue(np.array_equal(tiled_map.get_window(-10, -5, 10, 20), dense[10:20, 25:45]))
+        window = tiled_map.get_window(20, 30, 20, 20)
+        self.assertTrue(np.array_equal(window[:10, :10], dense[40:, 60:]))
+        self.assertTrue(np.all(window[10:, :] == 0))
+        self.assertTrue(np.array_equal(tiled_map.get(cells), dense.ravel()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+from playground.environment.world import World, convert_map, get_distance_map_file_name
+
+
+def create_world(height=200, width=300, file_name=None):
+    """
+    World with walls and two obstacles, the map is kept in the given file or in a temporary one
+    """
+    world_map = np.full((height, width, 3), 255, dtype=np.uint8)
+    world_map[:5, :] = 0
+    world_map[-5:, :] = 0
+    world_map[:, :5] = 0
+    world_map[:, -5:] = 0
+    world_map[60:80, 150:230] = 0
+    world_map[120:180, 40:60] = 0
+    if file_name is not None:
+        Image.fromarray(world_map).save(file_name)
+        return World(file_name)
+    with tempfile.TemporaryDirectory() as dir_name:
+        file_name = os.path.join(dir_name, 'map.png')
+        Image.fromarray(world_map).save(file_name)
+        return World(file_name)
+
+
+def get_obstacles_in_circle(world, pos, radius):
+    # brute force check of the whole map
+    x = np.clip(world.width // 2 + pos[1], 0, world.width).astype(int)
+    y = np.clip(world.height // 2 - pos[0], 0, world.height).astype(int)
+    obstacles = []
+    for map_y in range(world.height):
+        for map_x in range(world.width):
+            if int(np.sqrt((map_x - x) ** 2 + (map_y - y) ** 2)) <= radius:
+                world_pos = world.height // 2 - map_y, map_x - world.width // 2
+                if world.is_obstacle(world_pos)[0]:
+                    obstacles.append(world_pos)
+    return np.array(obstacles, dtype=int).reshape((-1, 2))
+
+
+class WorldTests(unittest.TestCase):
+
+    def test_preprocessed_map(self):
+        world_map = np.full((200, 300, 3), 255, dtype=np.uint8)
+        world_map[:5, :] = 0
+        world_map[60:80, 150:230] = 0
+        with tempfile.TemporaryDirectory() as dir_name:
+            image_file_name = os.path.join(dir_name, 'map.png')
+            Image.fromarray(world_map).save(image_file_name)
+            map_file_name = os.path.join(dir_name, 'map.npy')
+            convert_map(image_file_name, map_file_name)
+            self.assertTrue(os.path.exists(get_distance_map_file_name(map_file_name)))
+            # only the packed map is stored, rows are padded to whole bytes
+            self.assertEqual(np.load(map_file_name, mmap_mode='r').shape, (200, 38))
+
+            image_world = World(image_file_name)
+            world = World(map_file_name)
+            self.assertEqual((world.height, world.width), (200, 300))
+            rng = np.random.default_rng(0)
+            positions = np.stack([rng.integers(-100, 100, 500), rng.integers(-150, 150, 500)], axis=1)
+            self.assertTrue(np.array_equal(world.get_obstacles_mask(positions),
+                                           image_world.get_obstacles_mask(positions)))
+            self.assertTrue(np.array_equal(world.get_obstacle_distances(positions),
+                                           image_world.get_obstacle_distances(positions)))
+            self.assertTrue(np.array_equal(world.allow_moves(positions, 25), image_world.allow_moves(positions, 25)))
+
+    def test_allow_move(self):
+        world = create_world()
+        for y in range(-100, 101, 7):
+            for x in range(-150, 151, 7):
+                pos = np.array([y + 0.5, x - 0.5])
+                expected = world.get_obstacles_in_circle(pos, 25).size == 0
+                self.assertEqual(world.allow_move(pos, 25), expected)
+
+    def test_allow_move_large_body(self):
+        # squared distances to obstacles are saturated, larger bodies are checked with the obstacles search
+        world = create_world(height=1000, width=1000)
+        positions = np.array([[0., 0.], [100., 100.], [-150., 50.]])
+        for size in [300, 400]:
+            expected = [world.get_obstacles_in_circle(pos, size).size == 0 for pos in positions]
+            self.assertEqual([world.allow_move(pos, size) for pos in positions], expected)
+            self.assertTrue(np.array_equal(world.allow_moves(positions, size), expected))
+
+    def test_allow_moves(self):
+        world = create_world()
+        positions = np.array([[0., 0.], [70.5, 0.], [-60., -30.], [0., 1000.], [500., 500.]])
+        allowed = world.allow_moves(positions, 25)
+        expected = [world.allow_move(pos, 25) for pos in positions]
+        self.assertTrue(np.array_equal(allowed, expected))
+
+    def test_obstacles_in_circle(self):
+        world = create_world(height=60, width=80)
+        for pos in [(0, 0), (25.5, -30.2), (-30, 40), (100, -100)]:
+            obstacles = world.get_obstacles_in_circle(np.array(pos), 12)
+            expected = get_obstacles_in_circle(world, np.array(pos), 12)
+            self.assertTrue(np.array_equal(obstacles, expected))
+
+    def test_obstacle_distances(self):
+        world = create_world()
+        positions = np.array([[0, 0], [90, 0], [-90, 0], [0, 1000]])
+        distances = world.get_obstacle_distances(positions)
+        self.assertTrue(np.allclose(distances, [21, 6, 5, 0]))
+
+    def test_obstacles_mask(self):
+        # the width isn't a multiple of eight so the last packed byte is partially used
+        world = create_world(height=201, width=301)
+        map_y, map_x = np.indices((201, 301))
+        positions = np.stack([100 - map_y.ravel(), map_x.ravel() - 150], axis=1)
+        mask = world.get_obstacles_mask(positions).reshape((201, 301))
+        expected = np.zeros((201, 301), dtype=bool)
+        expected[:5, :] = expected[-5:, :] = expected[:, :5] = expected[:, -5:] = True
+        expected[60:80, 150:230] = expected[120:180, 40:60] = True
+        self.assertTrue(np.array_equal(mask, expected))
+        self.assertEqual(world.is_obstacle((100, 150))[0], True)
+        self.assertEqual(world.is_obstacle((0, 0))[0], False)
+
+
+if __name__ == '__main__':
+    unittest.main()